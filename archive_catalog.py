@@ -0,0 +1,576 @@
+"""
+Archive catalog - a small SQLite sidecar index of the files in pins_data.
+
+The catalog stores per-file metadata (channel, guild, type, item count and
+timestamp) so the viewer's index page never has to parse archive bodies,
+one row per archived item saying where to find it in its archive, plus an
+FTS5 full-text index over message content, author names and embed text
+for /api/search. Entries are refreshed incrementally: a file is only
+re-read when its mtime or size no longer matches what the catalog recorded,
+and an NDJSON archive that is still growing only has its new lines read.
+Files that fail to index are recorded too, and retried once they change.
+
+Message bodies of uncompressed NDJSON archives stay in the archives and
+are read back by seeking to their line's byte offset. JSON documents and
+compressed archives can't be seeked into, so their items are kept here
+(compressed NDJSON as the compact line the archive holds). The author and
+embed definitions of schema version 2 archives are kept here too, since a
+seek skips the lines that define them.
+"""
+
+import os
+import re
+import json
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+
+from archive_io import (
+    is_archive_filename, is_ndjson_filename, is_compressed_filename, stream_archive, archive_summary,
+    iter_ndjson_offsets, iter_ndjson_lines, author_definition, denormalize_record, iso_to_ms,
+    HEADER_KEY, MANIFEST_KEY, AUTHOR_KEY, EMBED_KEY
+)
+
+CATALOG_FILENAME = "catalog.db"
+
+# Bump when the schema or the indexed fields change; older catalogs are
+# rebuilt from the archive files on the next refresh.
+CATALOG_VERSION = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    filename TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    archive_type TEXT NOT NULL,
+    channel_name TEXT,
+    guild_id INTEGER,
+    guild_name TEXT,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    archived_at TEXT,
+    complete INTEGER,
+    indexed_bytes INTEGER,
+    error TEXT
+);
+
+CREATE TABLE IF NOT EXISTS archive_items (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    offset INTEGER,
+    item_json TEXT,
+    created_ts INTEGER,
+    author_name TEXT,
+    content TEXT,
+    embed_text TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS archive_items_by_file ON archive_items (filename, position);
+CREATE INDEX IF NOT EXISTS archive_items_by_time ON archive_items (filename, created_ts);
+
+CREATE TABLE IF NOT EXISTS archive_definitions (
+    filename TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value_json TEXT NOT NULL,
+    PRIMARY KEY (filename, kind, key)
+) WITHOUT ROWID;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS archive_items_fts USING fts5(
+    content, author_name, embed_text,
+    content='archive_items', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS archive_items_ai AFTER INSERT ON archive_items BEGIN
+    INSERT INTO archive_items_fts (rowid, content, author_name, embed_text)
+    VALUES (new.id, new.content, new.author_name, new.embed_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS archive_items_ad AFTER DELETE ON archive_items BEGIN
+    INSERT INTO archive_items_fts (archive_items_fts, rowid, content, author_name, embed_text)
+    VALUES ('delete', old.id, old.content, old.author_name, old.embed_text);
+END;
+"""
+
+# Relative column weights for bm25(): content, author name, embed text
+SEARCH_WEIGHTS = (1.0, 0.75, 0.5)
+
+def catalog_path(data_dir):
+    """Location of the catalog database for a pins_data directory"""
+    return os.path.join(data_dir, CATALOG_FILENAME)
+
+def _schema_statements():
+    """SCHEMA split into single statements (triggers kept whole), to run inside one transaction"""
+    statement = ''
+    for line in SCHEMA.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+
+def _ensure_schema(conn):
+    """Create the schema, discarding catalogs written by an older version"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != CATALOG_VERSION:
+        # One transaction, so other connections never see the tables half rebuilt
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another connection may have rebuilt it while this one waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+                for table in ('archive_items_fts', 'archive_items', 'archive_definitions', 'archives'):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                for statement in _schema_statements():
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+    else:
+        conn.executescript(SCHEMA)
+
+@contextmanager
+def open_catalog(data_dir, immediate=False):
+    """Open the catalog database in a transaction, creating the schema if needed.
+
+    With ``immediate`` the transaction takes the write lock up front, so
+    rows read in it can't go stale before they are updated: two processes
+    refreshing the same growing archive would otherwise both index the
+    lines it gained.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    conn = sqlite3.connect(catalog_path(data_dir), timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        _ensure_schema(conn)
+        with conn:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+    finally:
+        conn.close()
+
+def _scan_archive_files(data_dir):
+    """Return {filename: os.stat_result} for every archive file in data_dir"""
+    files = {}
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and is_archive_filename(entry.name):
+                files[entry.name] = entry.stat()
+    return files
+
+def directory_signature(data_dir):
+    """Hash of every archive's name, mtime and size; changes whenever an archive is added, changed or removed"""
+    if not os.path.exists(data_dir):
+        return ''
+    digest = hashlib.sha1()
+    for filename, stat in sorted(_scan_archive_files(data_dir).items()):
+        digest.update(f"{filename}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _embed_text(item):
+    """Flatten the searchable text of a message's embeds"""
+    parts = []
+    for embed in item.get('embeds') or []:
+        for key in ('title', 'description'):
+            if embed.get(key):
+                parts.append(embed[key])
+        for field in embed.get('fields') or []:
+            parts.append(f"{field.get('name', '')} {field.get('value', '')}")
+    return "\n".join(parts)
+
+def _compact_json(obj):
+    """Item JSON as kept in the catalog"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+def is_seekable(filename):
+    """Uncompressed NDJSON archives are read back by byte offset"""
+    return is_ndjson_filename(filename) and not is_compressed_filename(filename)
+
+def _item_row(filename, position, offset, item_json, item):
+    """archive_items values for an item in the version 1 shape, found at ``offset`` or stored as ``item_json``"""
+    return (
+        filename, position, offset, item_json,
+        item.get('created_ts') or iso_to_ms(item.get('created_at')),
+        (item.get('author') or {}).get('name'),
+        item.get('content'),
+        _embed_text(item),
+    )
+
+def _scan_ndjson(file_path, filename, meta, definitions, start=0, position=0, authors=None, embeds=None):
+    """Yield archive_items rows of an NDJSON archive: line offsets, or the lines of a compressed one.
+
+    Fills in ``meta`` as stream_archive() does (plus ``end_offset``, where
+    the next scan of a growing uncompressed file starts) and collects the author and
+    embed definitions into ``definitions`` ({(kind, key): value}). To pick
+    up where an earlier scan stopped, pass its end offset and item count as
+    ``start``/``position`` and the definitions it saw as ``authors``/``embeds``.
+    """
+    authors = {} if authors is None else authors
+    embeds = {} if embeds is None else embeds
+    count = position
+    complete = meta.get('complete') or False
+    if is_seekable(filename):
+        lines = iter_ndjson_offsets(file_path, start)
+        meta['end_offset'] = start
+    else:
+        lines = ((None, None, obj) for obj in iter_ndjson_lines(file_path))
+    for offset, next_offset, obj in lines:
+        meta['end_offset'] = next_offset
+        if AUTHOR_KEY in obj:
+            key, author = author_definition(obj[AUTHOR_KEY])
+            authors[key] = author
+            definitions[('author', key)] = author
+        elif EMBED_KEY in obj:
+            key = obj[EMBED_KEY]['key']
+            embeds[key] = obj[EMBED_KEY]['embed']
+            definitions[('embed', key)] = embeds[key]
+        elif HEADER_KEY in obj:
+            meta.update(obj[HEADER_KEY])
+        elif MANIFEST_KEY in obj:
+            meta.update(obj[MANIFEST_KEY])
+            complete = True
+        else:
+            item_json = _compact_json(obj) if offset is None else None
+            yield _item_row(filename, count, offset, item_json, denormalize_record(obj, authors, embeds))
+            count += 1
+            complete = False
+    meta['message_count'] = count
+    meta['complete'] = complete
+
+def _index_file(conn, data_dir, filename, stat):
+    """Read one archive and replace its catalog row, item locations and search entries"""
+    file_path = os.path.join(data_dir, filename)
+    meta = {}
+    definitions = {}
+    if is_ndjson_filename(filename):
+        rows = _scan_ndjson(file_path, filename, meta, definitions)
+    else:
+        rows = (
+            _item_row(filename, position, None, _compact_json(item), item)
+            for position, item in enumerate(stream_archive(file_path, meta))
+        )
+    conn.execute("DELETE FROM archive_items WHERE filename = ?", (filename,))
+    conn.execute("DELETE FROM archive_definitions WHERE filename = ?", (filename,))
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO archive_items (filename, position, offset, item_json, created_ts, author_name, content, embed_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO archive_definitions (filename, kind, key, value_json) VALUES (?, ?, ?, ?)",
+        (
+            (filename, kind, key, json.dumps(value, ensure_ascii=False))
+            for (kind, key), value in definitions.items()
+        )
+    )
+    # meta is only complete once the items generator has been consumed
+    summary = archive_summary(meta, filename)
+    complete = meta.get('complete')
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO archives
+            (filename, mtime_ns, size, archive_type, channel_name, guild_id, guild_name, item_count, archived_at,
+             complete, indexed_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            filename, stat.st_mtime_ns, stat.st_size,
+            summary['archive_type'], summary['channel_name'], summary['guild_id'],
+            summary['guild_name'], summary['item_count'], summary['archived_at'],
+            None if complete is None else int(complete), meta.get('end_offset'),
+        )
+    )
+
+def _index_appended(conn, data_dir, filename, stat, row):
+    """Index only the lines added to an NDJSON archive since it was last indexed"""
+    authors = {}
+    embeds = {}
+    for definition in conn.execute(
+        "SELECT kind, key, value_json FROM archive_definitions WHERE filename = ?", (filename,)
+    ):
+        table = authors if definition['kind'] == 'author' else embeds
+        table[definition['key']] = json.loads(definition['value_json'])
+    meta = {'complete': bool(row['complete'])}
+    definitions = {}
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO archive_items (filename, position, offset, item_json, created_ts, author_name, content, embed_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        _scan_ndjson(
+            os.path.join(data_dir, filename), filename, meta, definitions,
+            start=row['indexed_bytes'], position=row['item_count'], authors=authors, embeds=embeds
+        )
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO archive_definitions (filename, kind, key, value_json) VALUES (?, ?, ?, ?)",
+        (
+            (filename, kind, key, json.dumps(value, ensure_ascii=False))
+            for (kind, key), value in definitions.items()
+        )
+    )
+    conn.execute(
+        """
+        UPDATE archives SET mtime_ns = ?, size = ?, item_count = ?, complete = ?, indexed_bytes = ?
+        WHERE filename = ?
+        """,
+        (stat.st_mtime_ns, stat.st_size, meta['message_count'], int(meta['complete']), meta['end_offset'], filename)
+    )
+
+def _can_index_appended(data_dir, filename, stat, row):
+    """True if the file only grew past the last line indexed, as a streamed archive does"""
+    if row is None or row['error'] is not None or not is_seekable(filename):
+        return False
+    indexed_bytes = row['indexed_bytes']
+    # The header is the first line, so anything indexed includes it
+    if not indexed_bytes or stat.st_size < indexed_bytes:
+        return False
+    with open(os.path.join(data_dir, filename), 'rb') as f:
+        f.seek(indexed_bytes - 1)
+        return f.read(1) == b'\n'
+
+def _record_failure(conn, filename, stat, error):
+    """Remember a file that could not be indexed so it is not re-read until it changes"""
+    conn.execute("DELETE FROM archive_items WHERE filename = ?", (filename,))
+    conn.execute("DELETE FROM archive_definitions WHERE filename = ?", (filename,))
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO archives (filename, mtime_ns, size, archive_type, item_count, error)
+        VALUES (?, ?, ?, 'unknown', 0, ?)
+        """,
+        (filename, stat.st_mtime_ns, stat.st_size, str(error) or type(error).__name__)
+    )
+
+def _refresh_file(conn, data_dir, filename, stat, row):
+    """Bring one file's catalog entries up to date, returning False if it could not be indexed"""
+    try:
+        if _can_index_appended(data_dir, filename, stat, row):
+            _index_appended(conn, data_dir, filename, stat, row)
+        else:
+            _index_file(conn, data_dir, filename, stat)
+        return True
+    except Exception as e:
+        print(f"Error indexing {filename}: {e}")
+        _record_failure(conn, filename, stat, e)
+        return False
+
+def _load_definitions(conn, filename, records):
+    """Author and embed tables for the references used by a batch of version 2 records"""
+    wanted = set()
+    for record in records:
+        for field in ('author', 'original_author'):
+            ref = record.get(field)
+            if ref is not None and not isinstance(ref, dict):
+                wanted.add(('author', str(ref)))
+        for embed in record.get('embeds') or []:
+            if isinstance(embed, str):
+                wanted.add(('embed', embed))
+    tables = {'author': {}, 'embed': {}}
+    for kind in tables:
+        keys = [key for wanted_kind, key in wanted if wanted_kind == kind]
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            for row in conn.execute(
+                f"""
+                SELECT key, value_json FROM archive_definitions
+                WHERE filename = ? AND kind = ? AND key IN ({", ".join("?" * len(chunk))})
+                """,
+                [filename, kind] + chunk
+            ):
+                tables[kind][row['key']] = json.loads(row['value_json'])
+    return tables['author'], tables['embed']
+
+def _load_items(conn, data_dir, filename, rows):
+    """Read the items behind catalog rows (position, offset, item_json) as {position: item}"""
+    records = {}
+    if any(row['offset'] is not None for row in rows):
+        with open(os.path.join(data_dir, filename), 'rb') as f:
+            for row in rows:
+                if row['offset'] is not None:
+                    f.seek(row['offset'])
+                    records[row['position']] = json.loads(f.readline())
+    for row in rows:
+        if row['item_json'] is not None:
+            records[row['position']] = json.loads(row['item_json'])
+    authors, embeds = _load_definitions(conn, filename, records.values())
+    return {position: denormalize_record(record, authors, embeds) for position, record in records.items()}
+
+def refresh_catalog(data_dir):
+    """Bring the catalog in line with the archive files on disk.
+
+    Only new or modified files (by mtime/size) are opened, and a streamed
+    archive that grew is only read from where the last refresh stopped; rows
+    for deleted files are dropped. Returns the number of files that were
+    (re)indexed.
+    """
+    if not os.path.exists(data_dir):
+        return 0
+
+    indexed = 0
+
+    with open_catalog(data_dir, immediate=True) as conn:
+        # Stat and compare under the write lock, so nobody indexes the same change concurrently
+        on_disk = _scan_archive_files(data_dir)
+        known = {row['filename']: row for row in conn.execute("SELECT * FROM archives")}
+
+        for filename in set(known) - set(on_disk):
+            conn.execute("DELETE FROM archive_items WHERE filename = ?", (filename,))
+            conn.execute("DELETE FROM archive_definitions WHERE filename = ?", (filename,))
+            conn.execute("DELETE FROM archives WHERE filename = ?", (filename,))
+
+        for filename, stat in on_disk.items():
+            row = known.get(filename)
+            if row is not None and (row['mtime_ns'], row['size']) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            if _refresh_file(conn, data_dir, filename, stat, row):
+                indexed += 1
+
+    return indexed
+
+def index_archive(file_path):
+    """(Re)index a single archive right after it has been written"""
+    data_dir, filename = os.path.split(file_path)
+    with open_catalog(data_dir, immediate=True) as conn:
+        row = conn.execute("SELECT * FROM archives WHERE filename = ?", (filename,)).fetchone()
+        _refresh_file(conn, data_dir, filename, os.stat(file_path), row)
+
+def ensure_indexed(data_dir, filename):
+    """Bring one archive's catalog entry up to date and return it, or None if the file is gone or unreadable"""
+    file_path = os.path.join(data_dir, filename)
+    if not is_archive_filename(filename) or not os.path.isfile(file_path):
+        return None
+
+    def is_current(row, stat):
+        return row is not None and (row['mtime_ns'], row['size']) == (stat.st_mtime_ns, stat.st_size)
+
+    with open_catalog(data_dir) as conn:
+        row = conn.execute("SELECT * FROM archives WHERE filename = ?", (filename,)).fetchone()
+    if not is_current(row, os.stat(file_path)):
+        # Check again under the write lock: another request may have indexed it meanwhile
+        with open_catalog(data_dir, immediate=True) as conn:
+            row = conn.execute("SELECT * FROM archives WHERE filename = ?", (filename,)).fetchone()
+            stat = os.stat(file_path)
+            if not is_current(row, stat):
+                _refresh_file(conn, data_dir, filename, stat, row)
+                row = conn.execute("SELECT * FROM archives WHERE filename = ?", (filename,)).fetchone()
+
+    if row['error'] is not None:
+        return None
+    entry = dict(row)
+    entry['complete'] = None if entry['complete'] is None else bool(entry['complete'])
+    return entry
+
+def archive_page(data_dir, filename, cursor=0, limit=50, query=None, since_ts=None, until_ts=None):
+    """Return one page of an archive's items in archive order.
+
+    ``cursor`` is the position of the first item to return (0 for the start);
+    the returned next_cursor is None once the archive is exhausted. With a
+    ``query`` only items matching it (as in search()) are returned;
+    ``since_ts``/``until_ts`` (milliseconds since the epoch, until exclusive)
+    limit the page to messages created in that range.
+    Call ensure_indexed() first so the catalog reflects the file on disk.
+    """
+    sql = "SELECT position, offset, item_json FROM archive_items WHERE filename = ? AND position >= ?"
+    params = [filename, cursor]
+    if since_ts is not None:
+        sql += " AND created_ts >= ?"
+        params.append(since_ts)
+    if until_ts is not None:
+        sql += " AND created_ts < ?"
+        params.append(until_ts)
+    if query:
+        expression = _match_expression(query)
+        if not expression:
+            return [], None
+        sql += " AND id IN (SELECT rowid FROM archive_items_fts WHERE archive_items_fts MATCH ?)"
+        params.append(expression)
+    sql += " ORDER BY position LIMIT ?"
+    params.append(limit + 1)
+
+    with open_catalog(data_dir) as conn:
+        rows = conn.execute(sql, params).fetchall()
+        loaded = _load_items(conn, data_dir, filename, rows[:limit])
+    items = [loaded[row['position']] for row in rows[:limit] if row['position'] in loaded]
+
+    next_cursor = rows[limit]['position'] if len(rows) > limit else None
+    return items, next_cursor
+
+def list_archives(data_dir):
+    """Return catalog entries for all archives, most recent filename first"""
+    if not os.path.exists(data_dir):
+        return []
+
+    refresh_catalog(data_dir)
+
+    with open_catalog(data_dir) as conn:
+        rows = conn.execute("SELECT * FROM archives WHERE error IS NULL ORDER BY filename DESC").fetchall()
+
+    archives = []
+    for row in rows:
+        entry = dict(row)
+        full = entry['archive_type'] == 'full_messages'
+        entry['file_path'] = os.path.join(data_dir, entry['filename'])
+        entry['display_type'] = 'Full Archive' if full else 'Pins Only'
+        entry['archive_timestamp'] = entry['archived_at'] if full else None
+        entry['reset_timestamp'] = None if full else entry['archived_at']
+        entry['complete'] = None if entry['complete'] is None else bool(entry['complete'])
+        archives.append(entry)
+    return archives
+
+def _match_expression(query):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    terms = re.findall(r"\w+", query.lower())
+    return " ".join(f'"{term}"*' for term in terms)
+
+def search(data_dir, query, limit=50, offset=0):
+    """Ranked full-text search over all archived items.
+
+    Returns (results, has_more) where each result carries the archive's
+    channel, filename, date and type alongside the matching item.
+    """
+    expression = _match_expression(query)
+    if not expression or not os.path.exists(data_dir):
+        return [], False
+
+    refresh_catalog(data_dir)
+
+    with open_catalog(data_dir) as conn:
+        rows = conn.execute(
+            f"""
+            SELECT i.filename, i.position, i.offset, i.item_json, a.channel_name, a.archived_at, a.archive_type
+            FROM archive_items_fts
+            JOIN archive_items i ON i.id = archive_items_fts.rowid
+            JOIN archives a ON a.filename = i.filename
+            WHERE archive_items_fts MATCH ?
+            ORDER BY bm25(archive_items_fts, {", ".join(map(str, SEARCH_WEIGHTS))}), a.filename DESC, i.position
+            LIMIT ? OFFSET ?
+            """,
+            (expression, limit + 1, offset)
+        ).fetchall()
+
+        # Read each archive once for all of its hits
+        by_file = {}
+        for row in rows[:limit]:
+            by_file.setdefault(row['filename'], []).append(row)
+        items = {}
+        for filename, file_rows in by_file.items():
+            try:
+                loaded = _load_items(conn, data_dir, filename, file_rows)
+            except (OSError, ValueError) as e:
+                print(f"Error reading search results from {filename}: {e}")
+                continue
+            for position, item in loaded.items():
+                items[(filename, position)] = item
+
+    results = [
+        {
+            'channel': row['channel_name'],
+            'filename': row['filename'],
+            'archive_date': row['archived_at'],
+            'archive_type': 'Full Archive' if row['archive_type'] == 'full_messages' else 'Pins Only',
+            'item': items[(row['filename'], row['position'])]
+        }
+        for row in rows[:limit]
+        if (row['filename'], row['position']) in items
+    ]
+    return results, len(rows) > limit
@@ -0,0 +1,640 @@
+"""
+Archive file helpers shared by the Discord bot and the pins viewer
+
+Two on-disk formats are supported:
+
+- ``.json``   a single JSON document (pins archives and classic full archives)
+- ``.ndjson`` a streamed full archive: one ``{"_header": {...}}`` line, one
+  line per message, and a trailing ``{"_manifest": {...}}`` line written when
+  the archive is closed. A file without a manifest (e.g. the bot died
+  mid-archive) is still readable up to its last complete line.
+
+Either format may be stored compressed (``.json.gz``, ``.ndjson.zst``, ...);
+every reader here decompresses transparently. Streamed archives are written
+uncompressed while in progress and compressed when they are closed.
+
+Schema version 2 (``schema_version`` in the document or header) stores each
+author and embed once and refers to it from the messages: JSON documents
+carry ``authors`` and ``embeds`` tables, NDJSON archives an ``{"_author":
+{...}}`` / ``{"_embed": {...}}`` line before the first message using it.
+Both are keyed by a hash of their content, so the same user seen with two
+display names (e.g. as the author of a forwarded message) is two entries.
+Files written before that keyed authors by user id; they still read fine.
+Timestamps are stored as ``created_ts`` (milliseconds since the epoch).
+The readers expand version 2 records back into the version 1 shape, so
+callers see the same records whichever version a file was written with.
+"""
+
+import os
+import io
+import gzip
+import json
+import hashlib
+import zlib
+import shutil
+import datetime
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON_EXTENSION = '.json'
+NDJSON_EXTENSION = '.ndjson'
+GZIP_SUFFIX = '.gz'
+ZSTD_SUFFIX = '.zst'
+COMPRESSION_SUFFIXES = (GZIP_SUFFIX, ZSTD_SUFFIX)
+ARCHIVE_EXTENSIONS = tuple(
+    base + suffix
+    for base in (JSON_EXTENSION, NDJSON_EXTENSION)
+    for suffix in ('',) + COMPRESSION_SUFFIXES
+)
+
+# Compression for newly written archives: "none" (default), "gzip" or "zstd"
+# (zstd needs the zstandard package and falls back to gzip without it)
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "none").lower()
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+if ARCHIVE_COMPRESSION == "zstd" and zstandard is None:
+    print("ARCHIVE_COMPRESSION=zstd but zstandard is not installed, using gzip")
+    ARCHIVE_COMPRESSION = "gzip"
+
+# Raised when reading a compressed file that was cut off mid-write
+_TRUNCATED_ERRORS = (EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+HEADER_KEY = '_header'
+MANIFEST_KEY = '_manifest'
+AUTHOR_KEY = '_author'
+EMBED_KEY = '_embed'
+
+# Schema for newly written archives: 2 (normalized, default) or 1 (inline authors/embeds)
+ARCHIVE_SCHEMA_VERSION = int(os.getenv("ARCHIVE_SCHEMA_VERSION", "2"))
+
+# Encoder used when writing archives:
+#   "json"    - standard library, indented documents (default)
+#   "compact" - standard library, no whitespace
+#   "orjson"  - orjson (much faster, compact); falls back to "compact" if not installed
+ARCHIVE_JSON_BACKEND = os.getenv("ARCHIVE_JSON_BACKEND", "json").lower()
+
+if ARCHIVE_JSON_BACKEND == "orjson" and orjson is None:
+    print("ARCHIVE_JSON_BACKEND=orjson but orjson is not installed, using compact json")
+    ARCHIVE_JSON_BACKEND = "compact"
+
+def encode_line(obj):
+    """Serialize one NDJSON line (without the newline)"""
+    if ARCHIVE_JSON_BACKEND == "orjson":
+        return orjson.dumps(obj).decode('utf-8')
+    if ARCHIVE_JSON_BACKEND == "compact":
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(obj, ensure_ascii=False)
+
+def encode_document(obj):
+    """Serialize a whole JSON archive document to UTF-8 bytes"""
+    if ARCHIVE_JSON_BACKEND == "orjson":
+        return orjson.dumps(obj)
+    if ARCHIVE_JSON_BACKEND == "compact":
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+def write_json_document(file_path, obj):
+    """Write a JSON archive document with the configured encoder (compressed if the name says so)"""
+    if ARCHIVE_SCHEMA_VERSION >= 2:
+        obj = normalize_document(obj)
+    data = encode_document(obj)
+    with open_archive_file(file_path, 'wb') as f:
+        f.write(data)
+
+def is_archive_filename(filename):
+    """Return True if the filename looks like a pins/messages archive"""
+    return filename.endswith(ARCHIVE_EXTENSIONS)
+
+def strip_compression_suffix(file_path):
+    """Return the path without a trailing .gz/.zst"""
+    for suffix in COMPRESSION_SUFFIXES:
+        if file_path.endswith(suffix):
+            return file_path[:-len(suffix)]
+    return file_path
+
+def is_ndjson_filename(file_path):
+    """True for streamed (NDJSON) archives, compressed or not"""
+    return strip_compression_suffix(file_path).endswith(NDJSON_EXTENSION)
+
+def is_compressed_filename(file_path):
+    return file_path.endswith(COMPRESSION_SUFFIXES)
+
+def compression_suffix():
+    """File suffix for newly written archives under ARCHIVE_COMPRESSION"""
+    return {"gzip": GZIP_SUFFIX, "zstd": ZSTD_SUFFIX}.get(ARCHIVE_COMPRESSION, '')
+
+def open_archive_file(file_path, mode='rb'):
+    """Open an archive file in binary mode, (de)compressing according to its suffix"""
+    if file_path.endswith(GZIP_SUFFIX):
+        return gzip.open(file_path, mode, compresslevel=GZIP_LEVEL)
+    if file_path.endswith(ZSTD_SUFFIX):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is needed to read {file_path}")
+        if 'r' in mode:
+            # Each appended run is its own frame, so keep reading past the first
+            reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True)
+            return io.BufferedReader(reader)
+        return zstandard.open(file_path, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+    return open(file_path, mode)
+
+def compress_file(file_path, compressed_path):
+    """Write a compressed copy of a plain file (via a temp file) and remove the original"""
+    base = strip_compression_suffix(compressed_path)
+    # Keep the compression suffix last so open_archive_file picks the codec
+    temp_path = f"{base}.tmp{compressed_path[len(base):]}"
+    with open(file_path, 'rb') as source, open_archive_file(temp_path, 'wb') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(temp_path, compressed_path)
+    os.remove(file_path)
+
+def decompress_file(compressed_path, file_path):
+    """Inverse of compress_file, keeping whatever decodes from a truncated file"""
+    temp_path = f"{file_path}.tmp"
+    with open_archive_file(compressed_path, 'rb') as source, open(temp_path, 'wb') as target:
+        try:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        except _TRUNCATED_ERRORS:
+            print(f"{compressed_path} is truncated, keeping the readable part")
+    os.replace(temp_path, file_path)
+    os.remove(compressed_path)
+
+def append_compressed(file_path, compressed_path):
+    """Append a plain file to a compressed one as a new gzip member / zstd frame, and remove it.
+
+    Readers decode the members back to back, so what is already in
+    ``compressed_path`` is never inflated or rewritten.
+    """
+    size = os.path.getsize(compressed_path)
+    try:
+        with open(file_path, 'rb') as source, open_archive_file(compressed_path, 'ab') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    except BaseException:
+        # A half-written member would hide everything after it from readers
+        with open(compressed_path, 'rb+') as f:
+            f.truncate(size)
+        raise
+    os.remove(file_path)
+
+def iter_ndjson_lines(file_path):
+    """Yield decoded objects from an NDJSON file, stopping at a torn final line"""
+    with open_archive_file(file_path, 'rb') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Only the last line can be partially written; anything
+                    # after it is not trustworthy either.
+                    print(f"Stopping at truncated line in {file_path}")
+                    return
+        except _TRUNCATED_ERRORS:
+            print(f"Stopping at truncated data in {file_path}")
+
+def iter_ndjson_offsets(file_path, start=0):
+    """Yield (offset, next_offset, obj) for each line of an uncompressed NDJSON file from byte offset ``start``.
+
+    Stops before a partially written last line, so the final next_offset
+    is where a later pass over a growing file should pick up.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            next_offset = offset + len(line)
+            if not line.endswith(b'\n'):
+                return
+            if line.strip():
+                try:
+                    obj = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    print(f"Stopping at unreadable line in {file_path}")
+                    return
+                yield offset, next_offset, obj
+            offset = next_offset
+
+def iso_to_ms(value):
+    """Milliseconds since the epoch for an ISO timestamp (naive ones are taken as UTC)"""
+    if not value:
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+def ms_to_iso(ms):
+    """Inverse of iso_to_ms, in the same format discord.py's created_at.isoformat() gives"""
+    if ms is None:
+        return None
+    return datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc).isoformat()
+
+def content_key(obj):
+    """Short stable hash of a JSON value, used to key author and embed definitions"""
+    canonical = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+class ArchiveNormalizer:
+    """Turns version 1 records into version 2 ones, remembering the authors and embeds seen.
+
+    normalize() returns the compact record plus the author/embed definitions
+    that have to be written before it (those not seen yet).
+    """
+
+    def __init__(self):
+        self.authors = {}  # content hash -> author dict
+        self.embeds = {}  # content hash -> embed dict
+
+    def _author_ref(self, author, definitions):
+        if not isinstance(author, dict):
+            return author
+        # Keyed by content (not user id) so per-message names and avatars survive
+        key = content_key(author)
+        if key not in self.authors:
+            self.authors[key] = author
+            definitions.append({AUTHOR_KEY: {"key": key, "author": author}})
+        return key
+
+    def _embed_ref(self, embed, definitions):
+        # Keyed by content so a resumed archive reuses the same keys
+        key = content_key(embed)
+        if key not in self.embeds:
+            self.embeds[key] = embed
+            definitions.append({EMBED_KEY: {"key": key, "embed": embed}})
+        return key
+
+    def normalize(self, record):
+        definitions = []
+        compact = dict(record)
+        for field in ('author', 'original_author'):
+            if field in compact:
+                compact[field] = self._author_ref(compact[field], definitions)
+        if compact.get('embeds'):
+            compact['embeds'] = [self._embed_ref(embed, definitions) for embed in compact['embeds']]
+        if 'created_at' in compact:
+            created_at = compact.pop('created_at')
+            compact['created_ts'] = iso_to_ms(created_at)
+        return compact, definitions
+
+def author_definition(definition):
+    """(key, author) of an ``_author`` line; older files wrote the bare author, keyed by id"""
+    if 'key' in definition and 'author' in definition:
+        return definition['key'], definition['author']
+    return str(definition.get('id')), definition
+
+def denormalize_record(record, authors, embeds):
+    """Expand a version 2 record back into the version 1 shape"""
+    expanded = dict(record)
+    for field in ('author', 'original_author'):
+        ref = expanded.get(field)
+        if ref is not None and not isinstance(ref, dict):
+            expanded[field] = authors.get(str(ref)) or {
+                "name": "Unknown", "username": "Unknown",
+                "id": ref if isinstance(ref, int) else None, "avatar_url": None
+            }
+    if expanded.get('embeds'):
+        expanded['embeds'] = [
+            embeds.get(embed, {}) if isinstance(embed, str) else embed
+            for embed in expanded['embeds']
+        ]
+    if 'created_ts' in expanded and 'created_at' not in expanded:
+        expanded['created_at'] = ms_to_iso(expanded['created_ts'])
+    return expanded
+
+def normalize_document(data):
+    """Return a version 2 copy of a JSON archive document"""
+    if 'authors' in data:
+        return data
+    items_key = 'messages' if is_full_archive(data) else 'pins'
+    normalizer = ArchiveNormalizer()
+    items = [normalizer.normalize(item)[0] for item in data.get(items_key, [])]
+    document = {k: v for k, v in data.items() if k != items_key}
+    document['schema_version'] = 2
+    document['authors'] = normalizer.authors
+    document['embeds'] = normalizer.embeds
+    document[items_key] = items
+    return document
+
+def denormalize_document(data):
+    """Return a version 1 copy of a JSON archive document (unchanged if it already is one)"""
+    if data.get('schema_version', 1) < 2:
+        return data
+    items_key = 'messages' if is_full_archive(data) else 'pins'
+    authors = data.get('authors') or {}
+    embeds = data.get('embeds') or {}
+    document = {k: v for k, v in data.items() if k not in ('authors', 'embeds', items_key)}
+    document[items_key] = [denormalize_record(item, authors, embeds) for item in data.get(items_key, [])]
+    return document
+
+def stream_archive(file_path, meta):
+    """Yield the pins/messages of an archive one at a time.
+
+    ``meta`` is filled in with the archive's top-level fields (everything
+    except the item list). For NDJSON archives the manifest fields and a
+    ``complete`` flag are merged in once the generator is exhausted.
+    """
+    if not is_ndjson_filename(file_path):
+        data = read_archive(file_path)
+        items = archive_items(data)
+        meta.update({k: v for k, v in data.items() if k not in ('messages', 'pins')})
+        yield from items
+        return
+
+    count = 0
+    complete = False
+    normalized = False
+    authors = {}
+    embeds = {}
+    for obj in iter_ndjson_lines(file_path):
+        if AUTHOR_KEY in obj:
+            key, author = author_definition(obj[AUTHOR_KEY])
+            authors[key] = author
+        elif EMBED_KEY in obj:
+            embeds[obj[EMBED_KEY]['key']] = obj[EMBED_KEY]['embed']
+        elif HEADER_KEY in obj:
+            meta.update(obj[HEADER_KEY])
+            normalized = meta.get('schema_version', 1) >= 2
+        elif MANIFEST_KEY in obj:
+            # Resumed archives contain one manifest per run; the latest wins
+            meta.update(obj[MANIFEST_KEY])
+            complete = True
+        else:
+            count += 1
+            complete = False
+            yield denormalize_record(obj, authors, embeds) if normalized else obj
+
+    meta['message_count'] = count
+    meta['complete'] = complete
+
+def read_json_archive(file_path):
+    """Load a single-document JSON archive"""
+    with open_archive_file(file_path, 'rb') as f:
+        return json.load(f)
+
+def read_archive(file_path):
+    """Load a complete archive file in the classic (version 1) JSON document shape"""
+    if not is_ndjson_filename(file_path):
+        return denormalize_document(read_json_archive(file_path))
+
+    meta = {}
+    messages = list(stream_archive(file_path, meta))
+    meta['messages'] = messages
+    return meta
+
+def is_full_archive(data):
+    """Full message archives carry archive_type, pin archives do not"""
+    return data.get('archive_type') == 'full_messages'
+
+def archive_items(data):
+    """Return the list of pins or messages stored in an archive"""
+    if is_full_archive(data):
+        return data.get('messages', [])
+    return data.get('pins', [])
+
+def archive_summary(data, filename):
+    """Extract the small set of metadata the index page needs from an archive"""
+    full = is_full_archive(data)
+    return {
+        "filename": filename,
+        "archive_type": "full_messages" if full else "pins",
+        "channel_name": data.get('channel_name'),
+        "guild_id": data.get('guild_id'),
+        "guild_name": data.get('guild_name'),
+        "item_count": data.get('message_count', 0) if full else data.get('pin_count', 0),
+        "archived_at": data.get('archive_timestamp') if full else data.get('reset_timestamp'),
+    }
+
+class JsonArchiveWriter:
+    """Collects messages in memory and writes one JSON document on close.
+
+    close() and abort() write the whole document, so call them off the
+    event loop. A lock keeps a write_many() still running in a worker
+    thread from racing them.
+    """
+
+    def __init__(self, file_path, header):
+        self.file_path = file_path
+        self.header = header
+        self.messages = []
+        self._lock = threading.Lock()
+
+    @property
+    def message_count(self):
+        return len(self.messages)
+
+    def write(self, record):
+        with self._lock:
+            self.messages.append(record)
+
+    def write_many(self, records):
+        with self._lock:
+            self.messages.extend(records)
+
+    def flush(self):
+        # Nothing reaches disk before close()
+        pass
+
+    def _write_document(self, complete):
+        with self._lock:
+            archive_data = dict(self.header)
+            archive_data['message_count'] = len(self.messages)
+            if not complete:
+                # Shown as incomplete by the viewer, like an NDJSON archive without a manifest
+                archive_data['complete'] = False
+            archive_data['messages'] = self.messages
+            write_json_document(self.file_path, archive_data)
+
+    def abort(self):
+        """Write the messages collected so far, marked incomplete"""
+        self._write_document(complete=False)
+
+    def close(self):
+        self._write_document(complete=True)
+
+def _truncate_torn_tail(file_path):
+    """Cut a partially written last line off an NDJSON file before appending"""
+    with open(file_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # Walk back to the last complete line
+        position = size
+        while position > 0:
+            step = min(8192, position)
+            position -= step
+            f.seek(position)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+def _read_header(file_path):
+    """Header of an existing (possibly compressed) NDJSON archive, or None if it has none"""
+    with open_archive_file(file_path, 'rb') as f:
+        try:
+            first_line = f.readline()
+        except _TRUNCATED_ERRORS:
+            return None
+    try:
+        obj = json.loads(first_line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return obj.get(HEADER_KEY) if isinstance(obj, dict) else None
+
+def _tail_objects(file_path, tail_bytes=65536):
+    """Yield the decodable lines near the end of a plain NDJSON file, last first"""
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - tail_bytes))
+        lines = f.read().split(b'\n')
+    for line in reversed(lines):
+        try:
+            obj = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+        if isinstance(obj, dict):
+            yield obj
+
+def last_record_id(file_path, tail_bytes=65536):
+    """Return the id of the last complete message line in an NDJSON archive.
+
+    Used when resuming: lines flushed after the last checkpoint was saved
+    are still on disk, and must not be fetched and written a second time.
+    """
+    for obj in _tail_objects(file_path, tail_bytes):
+        if 'id' in obj:
+            return obj['id']
+    return None
+
+def _ends_with_manifest(file_path):
+    """Whether the last complete line of a plain NDJSON file is a manifest"""
+    for obj in _tail_objects(file_path):
+        return MANIFEST_KEY in obj
+    return False
+
+class NdjsonArchiveWriter:
+    """Writes messages to disk as they arrive so memory use stays flat.
+
+    Lines are flushed every ``flush_every`` records, which bounds how much
+    work is lost if the process dies before ``close()`` writes the manifest.
+    Opening an existing file appends to it, which is how interrupted or
+    repeated archives are resumed.
+
+    Methods may be called from a worker thread; a lock keeps a write still
+    running in one thread from racing abort()/close() from another.
+
+    An appended file keeps the schema version its header was written with.
+    Author and embed definitions are repeated once per run, which keeps
+    resuming from having to read the whole file back.
+
+    A compressed archive is resumed with ``append_to``: this run's lines
+    go to the plain ``file_path`` (without a header), and close() appends
+    them to ``append_to`` as one new compressed member. A file_path left
+    behind by an interrupted run is picked up again the same way.
+
+    ``was_complete`` tells whether the archive being resumed already ended
+    with a manifest, i.e. a run that adds nothing can be discard()ed.
+    """
+
+    def __init__(self, file_path, header, flush_every=100, append_to=None):
+        self.file_path = file_path
+        self.flush_every = flush_every
+        self.append_to = append_to
+        self.message_count = 0
+        self.was_complete = False
+        self._lock = threading.Lock()
+        existing_header = None
+        if os.path.exists(file_path):
+            _truncate_torn_tail(file_path)
+            if append_to is None:
+                existing_header = _read_header(file_path)
+                self.was_complete = _ends_with_manifest(file_path)
+        if append_to is not None:
+            existing_header = _read_header(append_to)
+            # Only closed runs are compressed, so without leftovers it is complete
+            self.was_complete = not os.path.exists(file_path) or os.path.getsize(file_path) == 0
+        if existing_header is not None:
+            self.header = existing_header
+        else:
+            self.header = dict(header, schema_version=ARCHIVE_SCHEMA_VERSION)
+        schema_version = self.header.get('schema_version', 1)
+        self._normalizer = ArchiveNormalizer() if schema_version >= 2 else None
+        self._file = open(file_path, 'a', encoding='utf-8')
+        if self._file.tell() == 0 and append_to is None:
+            self._write_line({HEADER_KEY: self.header})
+            self._file.flush()
+
+    def _write_line(self, obj):
+        self._file.write(encode_line(obj))
+        self._file.write('\n')
+
+    def _write_record(self, record):
+        if self._normalizer:
+            record, definitions = self._normalizer.normalize(record)
+            for definition in definitions:
+                self._write_line(definition)
+        self._write_line(record)
+        self.message_count += 1
+        if self.message_count % self.flush_every == 0:
+            self._file.flush()
+
+    def write(self, record):
+        with self._lock:
+            self._write_record(record)
+
+    def write_many(self, records):
+        with self._lock:
+            for record in records:
+                self._write_record(record)
+
+    def flush(self):
+        """Push buffered lines to disk"""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def abort(self):
+        """Close without a manifest, leaving the archive marked incomplete"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            self._file.close()
+
+    def close(self):
+        with self._lock:
+            self._write_line({MANIFEST_KEY: {
+                "messages_written": self.message_count,
+                "completed_at": datetime.datetime.now().isoformat()
+            }})
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if self.append_to is not None:
+                append_compressed(self.file_path, self.append_to)
+
+    def discard(self):
+        """Close a resumed run that wrote nothing, leaving the archive as it was"""
+        with self._lock:
+            self._file.close()
+            if self.append_to is not None:
+                os.remove(self.file_path)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Archive storage benchmark - size and read latency of each archive format
+
+Writes the same synthetic full archive as plain and compressed JSON/NDJSON,
+in both archive schema versions (1: inline authors/embeds, 2: normalized),
+and reports file size, write time, the time to read the whole archive
+(read_archive, as the bot and older viewer code do) and the time until the
+first 50 messages are available (stream_archive, as catalog indexing does).
+
+Usage: python benchmarks/archive_compression.py [--messages 20000] [--repeat 5] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive_io
+from archive_io import (
+    JSON_EXTENSION, NDJSON_EXTENSION, GZIP_SUFFIX, ZSTD_SUFFIX,
+    NdjsonArchiveWriter, write_json_document, compress_file, read_archive, stream_archive
+)
+from synthetic_archives import iter_messages
+
+def synthetic_messages(count, seed=1):
+    """Messages shaped like real archive records (see synthetic_archives.py), without attachments"""
+    return list(iter_messages(count, seed=seed))
+
+def write_archive(file_path, header, messages):
+    """Write messages in the format implied by the filename"""
+    if archive_io.is_ndjson_filename(file_path):
+        plain_path = archive_io.strip_compression_suffix(file_path)
+        writer = NdjsonArchiveWriter(plain_path, header)
+        writer.write_many(messages)
+        writer.close()
+        if plain_path != file_path:
+            compress_file(plain_path, file_path)
+    else:
+        document = dict(header, message_count=len(messages), messages=messages)
+        write_json_document(file_path, document)
+
+def first_page_seconds(file_path, page_size=50):
+    started = time.perf_counter()
+    meta = {}
+    for position, _ in enumerate(stream_archive(file_path, meta)):
+        if position + 1 == page_size:
+            break
+    return time.perf_counter() - started
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    suffixes = ['', GZIP_SUFFIX] + ([ZSTD_SUFFIX] if archive_io.zstandard else [])
+    formats = [
+        (base + suffix, schema_version)
+        for base in (JSON_EXTENSION, NDJSON_EXTENSION)
+        for suffix in suffixes
+        for schema_version in (1, 2)
+    ]
+
+    header = {"guild_id": 1, "guild_name": "Benchmark", "channel_name": "bench",
+              "archive_type": "full_messages", "archive_timestamp": "2025-01-01T00:00:00"}
+    messages = synthetic_messages(args.messages)
+
+    print(f"{args.messages} messages, JSON backend: {archive_io.ARCHIVE_JSON_BACKEND}, best of {args.repeat}")
+    print(f"{'format':<14}{'schema':>7}{'size (KB)':>12}{'write (ms)':>12}{'read (ms)':>12}{'first 50 (ms)':>15}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for extension, schema_version in formats:
+            archive_io.ARCHIVE_SCHEMA_VERSION = schema_version
+            file_path = os.path.join(work_dir, f"bench_FULL{extension}")
+            write_times, read_times, first_page_times = [], [], []
+            for _ in range(args.repeat):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                write_times.append(timed(write_archive, file_path, header, messages))
+                read_times.append(timed(read_archive, file_path))
+                first_page_times.append(first_page_seconds(file_path))
+
+            result = {
+                "format": extension,
+                "schema_version": schema_version,
+                "size_bytes": os.path.getsize(file_path),
+                "write_ms": min(write_times) * 1000,
+                "read_ms": min(read_times) * 1000,
+                "read_ms_median": statistics.median(read_times) * 1000,
+                "first_page_ms": min(first_page_times) * 1000,
+            }
+            results.append(result)
+            print(f"{extension:<14}{schema_version:>7}{result['size_bytes'] / 1024:>12.0f}{result['write_ms']:>12.1f}"
+                  f"{result['read_ms']:>12.1f}{result['first_page_ms']:>15.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"messages": args.messages, "repeat": args.repeat,
+                       "json_backend": archive_io.ARCHIVE_JSON_BACKEND, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Local HTTP server standing in for Discord's attachment CDN
+
+Serves GET /attachments/<attachment id>/<size>/<filename> with `size` bytes
+that are unique per attachment id (so the bot's content-addressed store sees
+distinct blobs) but cheap to produce. .png/.jpg responses start with a real
+pre-encoded picture (with Pillow installed), so thumbnails can be made from
+the downloads. It can add a time-to-first-byte delay, cap the transfer
+rate, and fail a fraction of requests, to exercise the download pool's
+timeouts and failure handling.
+
+Run on its own with: python benchmarks/attachment_stub.py [--port 8765]
+"""
+
+import os
+import random
+import asyncio
+import hashlib
+import argparse
+import mimetypes
+
+from aiohttp import web
+
+from synthetic_archives import sample_image
+
+CHUNK_SIZE = 64 * 1024
+_FILLER = bytes(range(256)) * (CHUNK_SIZE // 256)
+
+class AttachmentStub:
+    """aiohttp server for fake attachment bytes.
+
+    ``latency`` is the delay before the response starts, ``bandwidth`` the
+    bytes per second each response is throttled to (None = unthrottled), and
+    ``failure_rate`` the fraction of requests answered with HTTP 500.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.02, bandwidth=None, failure_rate=0.0, seed=1):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _serve(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=500, text="Simulated CDN failure")
+
+        filename = request.match_info['filename']
+        head = sample_image(os.path.splitext(filename)[1].lower())
+        head += hashlib.sha256(request.match_info['attachment_id'].encode()).digest()
+        size = max(int(request.match_info['size']), len(head))
+        response = web.StreamResponse(headers={
+            'Content-Type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            'Content-Length': str(size),
+        })
+        await response.prepare(request)
+        sent = 0
+        while sent < size:
+            chunk = head[sent:sent + CHUNK_SIZE] if sent < len(head) else _FILLER
+            chunk = chunk[:size - sent]
+            await response.write(chunk)
+            sent += len(chunk)
+            if self.bandwidth:
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+        self.bytes_sent += sent
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/attachments/{attachment_id}/{size:\\d+}/{filename}', self._serve)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Port 0 picks a free port; report the one actually bound
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def stats(self):
+        return {"requests": self.requests, "failures": self.failures, "bytes_sent": self.bytes_sent}
+
+async def _serve_forever(args):
+    stub = await AttachmentStub(args.host, args.port, args.latency, args.bandwidth, args.failure_rate).start()
+    print(f"Serving fake attachments at {stub.base_url}/attachments/<id>/<size>/<filename>")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds before each response starts")
+    parser.add_argument('--bandwidth', type=float, help="Bytes per second per response")
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    try:
+        asyncio.run(_serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the bot's archive and reset pipelines
+
+Runs the real bot.py functions against the fake guild in fake_discord.py
+and the local attachment server in attachment_stub.py, so no Discord
+connection or network access is needed. Each scenario gets a freshly
+populated channel:
+
+- archive: save_all_messages_to_json (/archive_messages)
+- pins:    save_pins_to_json
+- reset:   reset_channel_with_preservation (save + forward pins, recreate the channel)
+- clear:   delete_unpinned_messages (the slow reset path and /resploot-clear)
+
+Simulated REST latency and Discord-like rate limits apply by default, so
+delete-heavy scenarios take as long as they would against Discord; use
+--latency-scale 0 and --no-rate-limits to time only the bot's own work.
+
+Usage: python benchmarks/bot_benchmark.py [--messages 1000] [--scenarios archive,pins,reset,clear]
+       [--latency-scale 1.0] [--no-rate-limits] [--random-429-rate 0.01] [--output bot_results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_discord import FakeDiscordAPI, FakeGuild, populate_channel
+from attachment_stub import AttachmentStub
+from viewer_benchmark import git_commit
+
+SCENARIOS = ("archive", "pins", "reset", "clear")
+
+async def run_scenario(bot, name, channel, guild):
+    """Run one pipeline and return its scenario-specific results"""
+    if name == "archive":
+        result = await bot.save_all_messages_to_json(channel, guild)
+        if result is None:
+            raise RuntimeError("save_all_messages_to_json failed")
+        return {
+            "archived_messages": result.message_count,
+            "bytes_written": result.bytes_written,
+            "attachments_downloaded": result.attachments_downloaded,
+            "attachments_failed": result.attachments_failed,
+            "messages_per_second": round(result.messages_per_second, 1),
+        }
+
+    if name == "pins":
+        pins = [pin async for pin in channel.pins()]
+        filepath = await bot.save_pins_to_json(channel.name, pins, guild)
+        if filepath is None:
+            raise RuntimeError("save_pins_to_json failed")
+        return {"pins": len(pins), "bytes_written": os.path.getsize(filepath)}
+
+    if name == "reset":
+        pinned = sum(1 for message in channel._messages.values() if message.pinned)
+        new_channel = await bot.reset_channel_with_preservation(channel)
+        archive_channel = next((c for c in guild.text_channels if c.name == "book-bot-pinned"), None)
+        return {
+            "pins": pinned,
+            "recreated": new_channel is not channel,
+            "forwarded": archive_channel.message_count - 1 if archive_channel else 0,
+        }
+
+    if name == "clear":
+        pinned_ids = {pin.id async for pin in channel.pins()}
+        deleted, preserved = await bot.delete_unpinned_messages(channel, pinned_ids)
+        return {"deleted": deleted, "preserved": preserved, "remaining": channel.message_count}
+
+    raise ValueError(f"Unknown scenario: {name}")
+
+async def run_benchmarks(args):
+    import bot
+    bot.GENERATE_THUMBNAILS = args.thumbnails
+
+    stub = await AttachmentStub(latency=args.attachment_latency, bandwidth=args.attachment_bandwidth,
+                                failure_rate=args.attachment_failure_rate).start()
+    results = {}
+    try:
+        for name in args.scenarios:
+            api = FakeDiscordAPI(
+                latency_scale=args.latency_scale,
+                rate_limits={route: None for route in FakeDiscordAPI().rate_limits} if args.no_rate_limits else None,
+                random_429_rate=args.random_429_rate,
+                seed=args.seed
+            )
+            guild = FakeGuild(api)
+            channel = populate_channel(
+                guild, f"bench-{name}", args.messages, stub.base_url,
+                pinned_every=args.pinned_every, attachment_every=args.attachment_every,
+                old_fraction=args.old_fraction, seed=args.seed
+            )
+            # Replies are resolved through bot.get_channel()
+            bot.bot.get_channel = guild.get_channel
+            # A fresh pins_data/ per scenario, so no scenario reuses another's downloads
+            os.makedirs(os.path.join(args.work_dir, name))
+            os.chdir(os.path.join(args.work_dir, name))
+            requests_before = stub.requests
+
+            print(f"Running {name} on {args.messages} messages...")
+            started = time.perf_counter()
+            outcome = await run_scenario(bot, name, channel, guild)
+            elapsed = time.perf_counter() - started
+            # Thumbnails are made in the background after the records are written
+            if bot.derivative_tasks:
+                await asyncio.gather(*bot.derivative_tasks, return_exceptions=True)
+            thumbnail_wait = time.perf_counter() - started - elapsed
+
+            results[name] = dict(
+                outcome,
+                messages=args.messages,
+                elapsed_seconds=round(elapsed, 3),
+                thumbnail_wait_seconds=round(thumbnail_wait, 3),
+                api=api.stats.as_dict(),
+                attachment_requests=stub.requests - requests_before,
+            )
+            print(f"  {elapsed:.2f}s, {api.stats.as_dict()['total_calls']} API calls, "
+                  f"{api.stats.as_dict()['total_rate_limited']} rate limited")
+    finally:
+        await stub.stop()
+        if bot.bot.http_session is not None and not bot.bot.http_session.closed:
+            await bot.bot.http_session.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--pinned-every', type=int, default=50, help="Pin every Nth message")
+    parser.add_argument('--attachment-every', type=int, default=10, help="Attach a file to every Nth message")
+    parser.add_argument('--old-fraction', type=float, default=0.05,
+                        help="Fraction of messages older than 14 days (these can't be bulk deleted)")
+    parser.add_argument('--latency-scale', type=float, default=1.0, help="Multiplier for simulated REST latency")
+    parser.add_argument('--no-rate-limits', action='store_true', help="Disable the simulated per-route rate limits")
+    parser.add_argument('--random-429-rate', type=float, default=0.0, help="Fraction of calls hit by a random 429")
+    parser.add_argument('--attachment-latency', type=float, default=0.02)
+    parser.add_argument('--attachment-bandwidth', type=float, help="Bytes per second per attachment download")
+    parser.add_argument('--attachment-failure-rate', type=float, default=0.0)
+    parser.add_argument('--thumbnails', action='store_true', help="Also generate thumbnails (needs Pillow)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bot_results.json', help="Where to write the results JSON")
+    args = parser.parse_args()
+    args.scenarios = [name for name in args.scenarios.split(',') if name]
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+    output = os.path.abspath(args.output)
+
+    # The bot writes pins_data/, checkpoints and its attachment index relative to the working directory
+    args.work_dir = tempfile.mkdtemp(prefix='bot-bench-')
+    try:
+        results = asyncio.run(run_benchmarks(args))
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ('output', 'work_dir')},
+        "results": results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+"""
+In-process stand-ins for the parts of discord.py the bot's reset and archive
+pipelines use, so they can be run and timed without a Discord connection.
+
+FakeGuild / FakeTextChannel / FakeMessage implement history(), pins(),
+fetch_message(), send(), delete(), delete_messages(), forward() and
+create_text_channel() with the same call shapes as discord.py. Every call
+that would be a REST request waits for a configurable latency and goes
+through a per-route rate limiter. When a route runs out of requests the
+caller gets a simulated 429 and waits out retry_after before the call goes
+through, which is what discord.py does internally. Errors the bot
+handles itself (NotFound, the 14-day bulk delete rule) raise the real
+discord exceptions.
+
+Attachment URLs point at the local stub in attachment_stub.py.
+"""
+
+import time
+import random
+import asyncio
+import datetime
+import collections
+
+import discord
+
+from synthetic_archives import WORDS, ATTACHMENT_KINDS, snowflake
+
+# Seconds per simulated REST call, by route
+DEFAULT_LATENCY = {
+    "history": 0.08,  # One page of up to 100 messages
+    "pins": 0.06,  # One page of up to 50 pins
+    "fetch_message": 0.05,
+    "send": 0.06,
+    "delete": 0.05,
+    "bulk_delete": 0.08,
+    "channel": 0.15,  # Channel create/delete
+}
+
+# (requests, per seconds) allowed per route before a 429, roughly Discord's buckets
+DEFAULT_RATE_LIMITS = {
+    "history": (50, 1.0),
+    "pins": (50, 1.0),
+    "fetch_message": (50, 1.0),
+    "send": (5, 5.0),
+    "delete": (5, 5.0),
+    "bulk_delete": (1, 1.0),
+    "channel": (5, 10.0),
+}
+
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14)
+
+class FakeHTTPResponse:
+    """Just enough of an aiohttp response to construct discord.HTTPException subclasses"""
+
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+class FakeDiscordStats:
+    """Counts of simulated REST calls and rate limiting"""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.rate_limited = collections.Counter()
+        self.rate_limit_wait = 0.0
+
+    def as_dict(self):
+        return {
+            "calls": dict(self.calls),
+            "total_calls": sum(self.calls.values()),
+            "rate_limited": dict(self.rate_limited),
+            "total_rate_limited": sum(self.rate_limited.values()),
+            "rate_limit_wait_seconds": round(self.rate_limit_wait, 3),
+        }
+
+class FakeDiscordAPI:
+    """Latency, rate limits and call accounting shared by one fake guild.
+
+    ``latency_scale`` multiplies every latency (0 makes calls instant),
+    ``rate_limits`` overrides DEFAULT_RATE_LIMITS per route (None disables
+    a route's limit), and ``random_429_rate`` adds 429s that hit at random
+    (as shared or global limits do) with a ``random_429_retry_after`` wait.
+    """
+
+    def __init__(self, latency=None, latency_scale=1.0, jitter=0.2, rate_limits=None,
+                 random_429_rate=0.0, random_429_retry_after=0.5, seed=1):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS, **(rate_limits or {}))
+        self.random_429_rate = random_429_rate
+        self.random_429_retry_after = random_429_retry_after
+        self.stats = FakeDiscordStats()
+        self._rng = random.Random(seed)
+        self._windows = {}  # route -> deque of request start times
+        self._locks = collections.defaultdict(asyncio.Lock)
+
+    async def _wait_for_bucket(self, route):
+        limit = self.rate_limits.get(route)
+        if not limit:
+            return
+        count, per = limit
+        async with self._locks[route]:
+            window = self._windows.setdefault(route, collections.deque())
+            while True:
+                now = time.monotonic()
+                while window and now - window[0] >= per:
+                    window.popleft()
+                if len(window) < count:
+                    window.append(now)
+                    return
+                retry_after = per - (now - window[0])
+                self.stats.rate_limited[route] += 1
+                self.stats.rate_limit_wait += retry_after
+                await asyncio.sleep(retry_after)
+
+    async def call(self, route):
+        """Simulate one REST request on a route"""
+        await self._wait_for_bucket(route)
+        if self.random_429_rate and self._rng.random() < self.random_429_rate:
+            self.stats.rate_limited[route] += 1
+            self.stats.rate_limit_wait += self.random_429_retry_after
+            await asyncio.sleep(self.random_429_retry_after)
+        self.stats.calls[route] += 1
+        delay = self.latency.get(route, 0.0) * self.latency_scale
+        if delay:
+            await asyncio.sleep(delay * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+class FakeAsset:
+    def __init__(self, url):
+        self.url = url
+
+    def __str__(self):
+        return self.url
+
+class FakeMember:
+    def __init__(self, member_id, name):
+        self.id = member_id
+        self.name = name
+        self.display_name = name.title()
+        self.display_avatar = FakeAsset(f"https://cdn.discordapp.com/avatars/{member_id}/{member_id:x}.png")
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+class FakeAttachment:
+    def __init__(self, attachment_id, filename, size, content_type, url):
+        self.id = attachment_id
+        self.filename = filename
+        self.size = size
+        self.content_type = content_type
+        self.url = url
+
+class FakeReaction:
+    def __init__(self, emoji, count):
+        self.emoji = emoji
+        self.count = count
+
+class FakeReference:
+    def __init__(self, message_id, channel_id, guild_id):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+
+class FakeMessage:
+    def __init__(self, channel, message_id, author, content, created_at, attachments=(),
+                 embeds=(), reactions=(), reference=None, pinned=False):
+        self.channel = channel
+        self.guild = channel.guild
+        self.id = message_id
+        self.author = author
+        self.content = content
+        self.created_at = created_at
+        self.attachments = list(attachments)
+        self.embeds = list(embeds)
+        self.reactions = list(reactions)
+        self.reference = reference
+        self.pinned = pinned
+        self.type = discord.MessageType.reply if reference else discord.MessageType.default
+
+    @property
+    def jump_url(self):
+        return f"https://discord.com/channels/{self.guild.id}/{self.channel.id}/{self.id}"
+
+    async def delete(self):
+        await self.guild.api.call("delete")
+        self.channel._remove(self.id)
+
+    async def forward(self, destination, *, fail_if_not_exists=True):
+        await self.guild.api.call("send")
+        return destination._add(self.guild.bot_user, "", reference=FakeReference(self.id, self.channel.id, self.guild.id))
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id, name, category=None, position=0, topic=None, slowmode_delay=0, overwrites=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category = category
+        self.position = position
+        self.topic = topic
+        self.slowmode_delay = slowmode_delay
+        self.overwrites = overwrites or {}
+        self.type = discord.ChannelType.text
+        self._messages = {}  # id -> FakeMessage, in creation order
+
+    def __str__(self):
+        return self.name
+
+    def _add(self, author, content, created_at=None, **kwargs):
+        created_at = created_at or discord.utils.utcnow()
+        message_id = snowflake(created_at, self.guild._next_sequence())
+        message = FakeMessage(self, message_id, author, content, created_at, **kwargs)
+        self._messages[message_id] = message
+        return message
+
+    def _remove(self, message_id):
+        if self._messages.pop(message_id, None) is None:
+            raise discord.NotFound(FakeHTTPResponse(404, "Not Found"), "Unknown Message")
+
+    @property
+    def message_count(self):
+        return len(self._messages)
+
+    async def history(self, limit=100, before=None, after=None, oldest_first=None):
+        """Pages through messages 100 per simulated request, like TextChannel.history"""
+        if oldest_first is None:
+            oldest_first = after is not None
+        after_id = after.id if after else None
+        before_id = before.id if before else None
+        ids = sorted(self._messages, reverse=not oldest_first)
+        ids = [i for i in ids if (after_id is None or i > after_id) and (before_id is None or i < before_id)]
+        if limit is not None:
+            ids = ids[:limit]
+        for start in range(0, len(ids), 100):
+            await self.guild.api.call("history")
+            for message_id in ids[start:start + 100]:
+                message = self._messages.get(message_id)
+                if message is not None:
+                    yield message
+
+    async def pins(self, limit=None):
+        pinned = [m for m in sorted(self._messages.values(), key=lambda m: m.id, reverse=True) if m.pinned]
+        if limit is not None:
+            pinned = pinned[:limit]
+        for start in range(0, max(len(pinned), 1), 50):
+            await self.guild.api.call("pins")
+            for message in pinned[start:start + 50]:
+                yield message
+
+    async def fetch_message(self, message_id):
+        await self.guild.api.call("fetch_message")
+        message = self._messages.get(message_id)
+        if message is None:
+            raise discord.NotFound(FakeHTTPResponse(404, "Not Found"), "Unknown Message")
+        return message
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        await self.guild.api.call("send")
+        return self._add(self.guild.bot_user, content or "", embeds=[embed] if embed else [])
+
+    async def delete_messages(self, messages):
+        if len(messages) < 2 or len(messages) > 100:
+            raise discord.HTTPException(FakeHTTPResponse(400, "Bad Request"), "Must delete 2 to 100 messages")
+        await self.guild.api.call("bulk_delete")
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        if any(message.created_at < cutoff for message in messages):
+            raise discord.HTTPException(FakeHTTPResponse(400, "Bad Request"),
+                                        "You can only bulk delete messages that are under 14 days old.")
+        for message in messages:
+            self._messages.pop(message.id, None)
+
+    async def delete(self):
+        await self.guild.api.call("channel")
+        self.guild._channels.pop(self.id, None)
+
+class FakeGuild:
+    """A guild holding fake text channels, all sharing one FakeDiscordAPI"""
+
+    def __init__(self, api=None, guild_id=100000000000000001, name="Benchmark Server"):
+        self.api = api or FakeDiscordAPI()
+        self.id = guild_id
+        self.name = name
+        self.bot_user = FakeMember(999000000000000000, "resploot")
+        self._channels = {}
+        self._sequence = 0
+
+    def _next_sequence(self):
+        self._sequence += 1
+        return self._sequence
+
+    @property
+    def text_channels(self):
+        return list(self._channels.values())
+
+    @property
+    def channels(self):
+        return self.text_channels
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def _add_channel(self, name, **kwargs):
+        channel_id = snowflake(discord.utils.utcnow(), self._next_sequence())
+        channel = FakeTextChannel(self, channel_id, name, **kwargs)
+        self._channels[channel_id] = channel
+        return channel
+
+    async def create_text_channel(self, name, *, category=None, position=None, topic=None,
+                                  slowmode_delay=None, overwrites=None, **kwargs):
+        await self.api.call("channel")
+        return self._add_channel(name, category=category, position=position or 0, topic=topic,
+                                 slowmode_delay=slowmode_delay or 0, overwrites=overwrites)
+
+def populate_channel(guild, name, message_count, attachment_base_url, pinned_every=50,
+                     attachment_every=10, old_fraction=0.3, authors=25, seed=1):
+    """Create a text channel filled with `message_count` realistic messages.
+
+    The oldest ``old_fraction`` of the messages are more than 14 days old (so
+    deletes of them cannot be bulked); the rest are spread over the last 13
+    days. Every ``pinned_every``-th message is pinned, every
+    ``attachment_every``-th has attachments served by the stub at
+    ``attachment_base_url``, and some are replies to earlier messages.
+    """
+    rng = random.Random(seed)
+    channel = guild._add_channel(name, topic=f"Benchmark channel with {message_count} messages")
+    members = [FakeMember(200000000000000000 + i, f"member{i}") for i in range(authors)]
+    now = discord.utils.utcnow()
+    old_count = int(message_count * old_fraction)
+    recent_span = datetime.timedelta(days=13).total_seconds()
+    attachment_id = 500000000000000000
+    message_ids = []
+
+    for i in range(message_count):
+        if i < old_count:
+            created_at = now - datetime.timedelta(days=60) + datetime.timedelta(seconds=i * 60)
+        else:
+            offset = recent_span * (1 - (i - old_count) / max(message_count - old_count, 1))
+            created_at = now - datetime.timedelta(seconds=offset)
+
+        attachments = []
+        if attachment_every and i % attachment_every == 0:
+            extension, content_type, size, _ = ATTACHMENT_KINDS[i // attachment_every % len(ATTACHMENT_KINDS)]
+            attachment_id += 1
+            filename = f"file{i}{extension}"
+            attachments.append(FakeAttachment(
+                attachment_id, filename, size, content_type,
+                f"{attachment_base_url}/attachments/{attachment_id}/{size}/{filename}"
+            ))
+
+        reference = None
+        if i > 10 and i % 10 == 3:
+            reference = FakeReference(message_ids[rng.randrange(max(0, i - 200), i)], channel.id, guild.id)
+
+        message = channel._add(
+            rng.choice(members),
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 50))),
+            created_at=created_at,
+            attachments=attachments,
+            embeds=[discord.Embed(title=f"Link {i % 20}", url=f"https://example.com/{i % 20}",
+                                  description=" ".join(rng.choice(WORDS) for _ in range(30)))] if i % 5 == 0 else [],
+            reactions=[FakeReaction(rng.choice(["👍", "😂", "🎉"]), rng.randint(1, 9))] if i % 7 == 0 else [],
+            reference=reference,
+            pinned=bool(pinned_every) and i % pinned_every == 0,
+        )
+        message_ids.append(message.id)
+
+    return channel
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Synthetic pins_data trees for benchmarks
+
+Generates pins-only archives and _FULL_ message archives shaped like the
+bot's output: a pool of recurring authors, link embeds, replies and
+forwards referring to earlier messages, and attachments stored as
+content-addressed blobs under attachments/blobs/ (a mix of small images
+and a few large media files, so serving can be measured on both). Image
+blobs start with a real PNG/JPEG when Pillow is installed, so thumbnails
+can be made from them.
+
+The word list, snowflake() and the attachment kinds are shared with
+fake_discord.py and attachment_stub.py.
+
+Full archives are streamed to disk as NDJSON, so even a 1M message archive
+is generated with flat memory use. Output is deterministic for a seed.
+
+Usage: python benchmarks/synthetic_archives.py OUTPUT_DIR [--full-sizes 10,1000,100000] [--pins 5]
+"""
+
+import io
+import os
+import sys
+import json
+import random
+import functools
+import hashlib
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive_io import NdjsonArchiveWriter, write_json_document, NDJSON_EXTENSION, JSON_EXTENSION
+
+try:
+    from PIL import Image
+except ImportError:  # Image blobs are then plain random bytes
+    Image = None
+
+WORDS = ("the a reset pinned channel daily chat voice archive message bot server link image lol yes no "
+         "maybe tomorrow weekend movie game music photo meme birthday question answer thanks welcome").split()
+
+GUILD_ID = 100000000000000001
+GUILD_NAME = "Benchmark Server"
+DISCORD_EPOCH_MS = 1420070400000
+START_TIME = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+MESSAGE_INTERVAL_SECONDS = 37  # Spacing between consecutive synthetic messages
+
+# (extension, content type, size in bytes, how many distinct blobs)
+ATTACHMENT_KINDS = [
+    ('.png', 'image/png', 48 * 1024, 30),
+    ('.jpg', 'image/jpeg', 180 * 1024, 20),
+    ('.mp4', 'video/mp4', 4 * 1024 * 1024, 2),
+    ('.pdf', 'application/pdf', 300 * 1024, 3),
+]
+
+# Pixel size of the sample picture an image blob starts with
+IMAGE_DIMENSIONS = {
+    '.png': (800, 600),  # Screenshot-like
+    '.jpg': (1600, 1200),  # Photo-like
+}
+
+def snowflake(moment, sequence=0):
+    """Discord-style id for a creation time"""
+    ms = int(moment.timestamp() * 1000)
+    return ((ms - DISCORD_EPOCH_MS) << 22) | (sequence & 0x3fffff)
+
+@functools.lru_cache(maxsize=None)
+def sample_image(extension):
+    """Encoded sample picture for an image extension (encoded once per process).
+
+    Returns b'' for other extensions or without Pillow. Decoders stop at the
+    end of the image, so callers can pad it out to any size.
+    """
+    if Image is None or extension not in IMAGE_DIMENSIONS:
+        return b''
+    size = IMAGE_DIMENSIONS[extension]
+    gradient = Image.linear_gradient('L').resize(size)
+    picture = Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                                  Image.radial_gradient('L').resize(size)))
+    buffer = io.BytesIO()
+    picture.save(buffer, 'PNG' if extension == '.png' else 'JPEG', quality=85)
+    return buffer.getvalue()
+
+def make_authors(count, rng):
+    return [
+        {
+            "name": f"{rng.choice(WORDS).title()}{rng.choice(WORDS).title()}{i}",
+            "username": f"user{i}",
+            "id": 200000000000000000 + i,
+            "avatar_url": f"https://cdn.discordapp.com/avatars/{200000000000000000 + i}/{hashlib.md5(str(i).encode()).hexdigest()}.png"
+        }
+        for i in range(count)
+    ]
+
+def make_embeds(count, rng):
+    return [
+        {
+            "type": "rich" if i % 4 == 0 else "link",
+            "url": f"https://example.com/articles/{i}",
+            "title": " ".join(rng.choice(WORDS) for _ in range(6)).capitalize(),
+            "description": " ".join(rng.choice(WORDS) for _ in range(40)),
+            "fields": [{"name": "Votes", "value": str(rng.randint(1, 500)), "inline": True}] if i % 4 == 0 else []
+        }
+        for i in range(count)
+    ]
+
+def write_attachment_blobs(attachments_dir, seed=1):
+    """Create the pool of blob files and return their attachment records"""
+    rng = random.Random(seed)
+    records = []
+    for extension, content_type, size, count in ATTACHMENT_KINDS:
+        for i in range(count):
+            image = sample_image(extension)
+            data = image + rng.randbytes(max(0, size - len(image)))
+            sha256 = hashlib.sha256(data).hexdigest()
+            local_filename = f"blobs/{sha256[:2]}/{sha256}{extension}"
+            path = os.path.join(attachments_dir, local_filename)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+            filename = f"file_{i}{extension}"
+            records.append({
+                "filename": filename,
+                "local_path": os.path.join(attachments_dir, local_filename),
+                "local_filename": local_filename,
+                "sha256": sha256,
+                "url": f"https://cdn.discordapp.com/attachments/1/{i}/{filename}",
+                "original_url": f"https://cdn.discordapp.com/attachments/1/{i}/{filename}",
+                "size": size,
+                "content_type": content_type,
+                "downloaded": True
+            })
+    return records
+
+def iter_messages(count, seed=1, attachments=None, channel_id=300000000000000001,
+                  start=START_TIME, attachment_every=8, authors=25, embeds=20):
+    """Yield `count` archive records in chronological order"""
+    rng = random.Random(seed)
+    author_pool = make_authors(authors, rng)
+    embed_pool = make_embeds(embeds, rng)
+    recent = []  # (id, author) of recent messages, for replies and forwards
+
+    for i in range(count):
+        moment = start + datetime.timedelta(seconds=i * MESSAGE_INTERVAL_SECONDS)
+        message_id = snowflake(moment, i)
+        author = rng.choice(author_pool)
+
+        reference = None
+        original_author = None
+        if recent and i % 10 == 3:
+            referenced_id, referenced_author = rng.choice(recent)
+            reference = {"message_id": referenced_id, "channel_id": channel_id, "guild_id": GUILD_ID}
+            if i % 40 == 3:
+                original_author = referenced_author
+
+        message_attachments = []
+        if attachments and attachment_every and i % attachment_every == 0:
+            message_attachments = [dict(rng.choice(attachments)) for _ in range(1 + (i % 3 == 0))]
+
+        yield {
+            "id": message_id,
+            "author": author,
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 60))),
+            "created_at": moment.isoformat(),
+            "jump_url": f"https://discord.com/channels/{GUILD_ID}/{channel_id}/{message_id}",
+            "is_pinned": i % 97 == 0,
+            "attachments": message_attachments,
+            "embeds": [rng.choice(embed_pool)] if i % 5 == 0 else [],
+            "reactions": [{"emoji": rng.choice(["👍", "😂", "❤️", "🎉"]), "count": rng.randint(1, 9)}] if i % 7 == 0 else [],
+            "message_reference": reference,
+            "type": "MessageType.reply" if reference else "MessageType.default",
+            "original_author": original_author
+        }
+
+        recent.append((message_id, author))
+        if len(recent) > 200:
+            recent.pop(0)
+
+def write_full_archive(data_dir, channel_name, count, seed=1, attachments=None):
+    """Stream one _FULL_ archive of `count` messages; returns its filename"""
+    filename = f"{channel_name}_FULL_20250101_000000{NDJSON_EXTENSION}"
+    header = {
+        "guild_id": GUILD_ID,
+        "guild_name": GUILD_NAME,
+        "channel_name": channel_name,
+        "archive_type": "full_messages",
+        "archive_timestamp": "2025-01-01T00:00:00"
+    }
+    file_path = os.path.join(data_dir, filename)
+    if os.path.exists(file_path):
+        # The writer appends to existing files; regenerate from scratch instead
+        os.remove(file_path)
+    writer = NdjsonArchiveWriter(file_path, header, flush_every=1000)
+    batch = []
+    for record in iter_messages(count, seed=seed, attachments=attachments):
+        batch.append(record)
+        if len(batch) == 1000:
+            writer.write_many(batch)
+            batch = []
+    writer.write_many(batch)
+    writer.close()
+    return filename
+
+def write_pins_archive(data_dir, channel_name, count, index, seed=1, attachments=None):
+    """Write one pins-only archive; returns its filename"""
+    moment = START_TIME + datetime.timedelta(days=7 * index)
+    filename = f"{channel_name}_{moment.strftime('%Y%m%d_%H%M%S')}{JSON_EXTENSION}"
+    pins = list(iter_messages(count, seed=seed + index, attachments=attachments, start=moment, attachment_every=3))
+    for pin in pins:
+        pin.pop('original_author')
+        pin.pop('is_pinned')
+    write_json_document(os.path.join(data_dir, filename), {
+        "guild_id": GUILD_ID,
+        "guild_name": GUILD_NAME,
+        "channel_name": channel_name,
+        "reset_timestamp": moment.replace(tzinfo=None).isoformat(),
+        "pin_count": len(pins),
+        "pins": pins
+    })
+    return filename
+
+def generate_tree(data_dir, full_sizes=(10, 1000, 100000), pins_archives=5, pins_per_archive=50, seed=1):
+    """Populate data_dir like the bot's pins_data directory.
+
+    Returns a manifest: {"full": {filename: count}, "pins": {filename: count},
+    "attachments": [attachment records]}.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    attachments = write_attachment_blobs(os.path.join(data_dir, "attachments"), seed)
+    manifest = {"full": {}, "pins": {}, "attachments": attachments}
+    for size in full_sizes:
+        filename = write_full_archive(data_dir, f"full-{size}", size, seed=seed, attachments=attachments)
+        manifest["full"][filename] = size
+    for index in range(pins_archives):
+        filename = write_pins_archive(data_dir, f"pins-{index % 3}", pins_per_archive, index, seed=seed, attachments=attachments)
+        manifest["pins"][filename] = pins_per_archive
+    return manifest
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('output_dir')
+    parser.add_argument('--full-sizes', type=parse_sizes, default=[10, 1000, 100000],
+                        help="Comma-separated message counts, one _FULL_ archive each (e.g. 10,1000,1000000)")
+    parser.add_argument('--pins', type=int, default=5, help="Number of pins-only archives")
+    parser.add_argument('--pins-per-archive', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    manifest = generate_tree(args.output_dir, args.full_sizes, args.pins, args.pins_per_archive, args.seed)
+    print(json.dumps({"full": manifest["full"], "pins": manifest["pins"],
+                      "attachment_blobs": len(manifest["attachments"])}, indent=2))
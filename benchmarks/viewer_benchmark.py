@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Pins viewer benchmarks
+
+Builds a synthetic pins_data tree (see synthetic_archives.py) and times the
+viewer through Flask's test client, without a network in the way:
+
+- load_all_archives: cold (empty catalog, everything indexed) and warm
+- /api/search for a few queries
+- /view/<filename>: cold (page cache empty) and warm, for every archive
+- /api/archive/<filename>/messages: first page and a page deep in the archive
+- /attachments/<path>: full transfer, a Range request and a 304 revalidation
+
+Results go to a JSON file together with the git commit, so runs from
+different commits can be compared with --compare.
+
+Usage: python benchmarks/viewer_benchmark.py [--full-sizes 10,1000,100000] [--repeat 20]
+       [--data-dir DIR] [--output viewer_results.json] [--compare OLD.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from synthetic_archives import generate_tree, parse_sizes
+
+SEARCH_QUERIES = ["birthday", "movie game", "pinned channel reset", "zzznomatch"]
+
+def summarize(samples):
+    """Timing statistics in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+
+def measure(func, repeat, setup=None):
+    """Run func `repeat` times (after setup() each time) and return its timing statistics"""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def request(client, url, expected_status=200, headers=None):
+    def run():
+        response = client.get(url, headers=headers)
+        if response.status_code != expected_status:
+            raise RuntimeError(f"{url} returned {response.status_code}, expected {expected_status}")
+        # Read the whole body so file transfers are actually timed
+        response.get_data()
+        response.close()
+    return run
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(work_dir, manifest, repeat):
+    """Time each viewer operation against the tree in work_dir/pins_data"""
+    os.chdir(work_dir)
+    import pins_viewer
+    import archive_catalog
+
+    pins_viewer.app.config['TESTING'] = True
+    client = pins_viewer.app.test_client()
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+
+    results = {}
+    data_dir = pins_viewer.PINS_DATA_DIR
+
+    def drop_catalog():
+        for suffix in ('', '-wal', '-shm'):
+            path = archive_catalog.catalog_path(data_dir) + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    print("load_all_archives (cold catalog)...")
+    results["load_all_archives.cold"] = measure(pins_viewer.load_all_archives, max(1, repeat // 10), setup=drop_catalog)
+    results["load_all_archives.warm"] = measure(pins_viewer.load_all_archives, repeat)
+    results["index.cold"] = measure(request(client, '/'), repeat, setup=pins_viewer.page_cache.clear)
+    results["index.warm"] = measure(request(client, '/'), repeat)
+
+    for query in SEARCH_QUERIES:
+        results[f"search[{query}]"] = measure(request(client, f'/api/search?q={query}'), repeat)
+
+    for filename in list(manifest["full"]) + list(manifest["pins"]):
+        print(f"/view/{filename}...")
+        results[f"view[{filename}].cold"] = measure(
+            request(client, f'/view/{filename}'), repeat, setup=pins_viewer.page_cache.clear
+        )
+        results[f"view[{filename}].warm"] = measure(request(client, f'/view/{filename}'), repeat)
+        results[f"messages[{filename}].first_page"] = measure(
+            request(client, f'/api/archive/{filename}/messages?limit=50'), repeat
+        )
+        count = manifest["full"].get(filename) or manifest["pins"].get(filename)
+        deep_cursor = max(0, count - 100)
+        results[f"messages[{filename}].deep_page"] = measure(
+            request(client, f'/api/archive/{filename}/messages?cursor={deep_cursor}&limit=50'), repeat
+        )
+
+    by_type = {}
+    for attachment in manifest["attachments"]:
+        by_type.setdefault(attachment["content_type"], attachment)
+    for content_type, attachment in sorted(by_type.items()):
+        url = f'/attachments/{attachment["local_filename"]}'
+        response = client.get(url)
+        etag = response.headers.get('ETag')
+        response.close()
+        label = f'{content_type},{attachment["size"] // 1024}KB'
+        results[f"attachment[{label}].full"] = measure(request(client, url), repeat)
+        results[f"attachment[{label}].range"] = measure(
+            request(client, url, 206, {'Range': 'bytes=0-65535'}), repeat
+        )
+        if etag:
+            results[f"attachment[{label}].not_modified"] = measure(
+                request(client, url, 304, {'If-None-Match': etag}), repeat
+            )
+    return results
+
+def print_results(results, previous=None):
+    print(f"{'benchmark':<64}{'median (ms)':>13}{'p95 (ms)':>11}" + (f"{'change':>10}" if previous else ""))
+    for name, stats in results.items():
+        line = f"{name:<64}{stats['median_ms']:>13.2f}{stats['p95_ms']:>11.2f}"
+        if previous and name in previous and previous[name]['median_ms']:
+            change = stats['median_ms'] / previous[name]['median_ms'] - 1
+            line += f"{change:>+10.0%}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--full-sizes', type=parse_sizes, default=[10, 1000, 100000],
+                        help="Comma-separated message counts of the _FULL_ archives (e.g. 10,1000,1000000)")
+    parser.add_argument('--pins', type=int, default=5, help="Number of pins-only archives")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', help="Generate into (or reuse) this directory instead of a temporary one")
+    parser.add_argument('--output', default='viewer_results.json', help="Where to write the results JSON")
+    parser.add_argument('--compare', help="Results JSON from an earlier run to compare against")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+
+    work_dir = os.path.abspath(args.data_dir) if args.data_dir else tempfile.mkdtemp(prefix='viewer-bench-')
+    try:
+        print(f"Generating archives in {work_dir} ...")
+        started = time.perf_counter()
+        manifest = generate_tree(os.path.join(work_dir, 'pins_data'), args.full_sizes, args.pins, seed=args.seed)
+        print(f"Generated in {time.perf_counter() - started:.1f}s")
+        results = run_benchmarks(work_dir, manifest, args.repeat)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results, previous)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"full_sizes": args.full_sizes, "pins": args.pins, "repeat": args.repeat, "seed": args.seed},
+        "results": results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,39 @@
 import os
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 import datetime
 import pytz
 import json
 import asyncio
+import logging
 import aiohttp
+import collections
+import functools
+import hashlib
+import heapq
+import itertools
+import multiprocessing
+import sqlite3
+import tempfile
+import threading
 import mimetypes
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 
+import archive_catalog
+import bot_metrics
+import thumbnails
+from archive_io import (
+    JSON_EXTENSION, NDJSON_EXTENSION, JsonArchiveWriter, NdjsonArchiveWriter,
+    last_record_id, write_json_document, compression_suffix, compress_file,
+    is_compressed_filename, strip_compression_suffix
+)
+
 # Load environment variables from .env
 load_dotenv()
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -18,118 +41,621 @@ TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 # Bot setup - message content intent needed to read pin content
 intents = discord.Intents.default()
 intents.message_content = True  # Required to read message content for pins
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+def create_http_session():
+    """Create the bot's pooled HTTP client with keep-alive and DNS caching"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_SIZE,
+        limit_per_host=ATTACHMENT_PER_HOST_LIMIT,
+        keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        ttl_dns_cache=HTTP_DNS_CACHE_SECONDS
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=30, connect=10)  # 30s total, 10s connect timeout
+    )
+
+class ResplootBot(commands.Bot):
+    """Bot that owns one long-lived HTTP session for attachment downloads"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http_session = None
+        self.metrics_runner = None
+        self.loop_lag_monitor = None
+
+    def get_http_session(self):
+        """Return the shared HTTP session, creating it if it is missing or closed"""
+        if self.http_session is None or self.http_session.closed:
+            self.http_session = create_http_session()
+        return self.http_session
+
+    async def setup_hook(self):
+        self.get_http_session()
+        self.loop_lag_monitor = bot_metrics.EventLoopLagMonitor(EVENT_LOOP_LAG, EVENT_LOOP_LAG_LAST, EVENT_LOOP_LAG_INTERVAL)
+        self.loop_lag_monitor.start()
+        if METRICS_PORT:
+            try:
+                self.metrics_runner = await bot_metrics.start_metrics_server(
+                    METRICS_HOST, METRICS_PORT, extra_json=lambda: {"recent_resets": list(reset_timings)}
+                )
+                print(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"Could not start metrics server on {METRICS_HOST}:{METRICS_PORT}: {e}")
+
+    async def close(self):
+        if self.loop_lag_monitor is not None:
+            self.loop_lag_monitor.stop()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        if self.http_session is not None and not self.http_session.closed:
+            await self.http_session.close()
+        await super().close()
+        # Let background thumbnail jobs and queued archive/checkpoint writes finish before exiting
+        if derivative_tasks:
+            await asyncio.gather(*derivative_tasks, return_exceptions=True)
+        io_executor.shutdown(wait=True)
+        if thumbnail_executor is not None:
+            thumbnail_executor.shutdown(wait=True)
+
+bot = ResplootBot(command_prefix="!", intents=intents)
 
 # Configuration
 GUILD_ID = None  # Set to None for global commands, or specify server ID for faster sync
 TIMEZONE = "America/Los_Angeles"  # Change this to your timezone
-SCHEDULES_FILE = "schedules.json"
+SCHEDULES_DB = "schedules.db"  # SQLite store for scheduled resets
+SCHEDULES_FILE = "schedules.json"  # Legacy schedule file, imported into SCHEDULES_DB once
+MISSED_RESET_POLICY = os.getenv("MISSED_RESET_POLICY", "latest")  # 'latest' = run a reset missed during downtime once, 'skip' = wait for the next one
+MISSED_RESET_GRACE_HOURS = 6  # Only catch up resets that were missed within this many hours
+MAX_CONCURRENT_RESETS = 4  # Scheduled resets allowed to run at once (always one at a time per guild)
+USE_BULK_DELETE = True  # Slow reset method: bulk-delete messages younger than 14 days instead of one call per message
+BULK_DELETE_BATCH_SIZE = 100  # Discord's maximum messages per bulk delete
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14)  # Discord rejects bulk deletes of older messages
+CLEAR_PROGRESS_EVERY = 500  # Messages walked between /resploot-clear progress updates
 PINS_DATA_DIR = "pins_data"  # Directory to store pin JSON files
 ATTACHMENTS_DIR = "pins_data/attachments"  # Directory to store downloaded attachments
+ATTACHMENT_BLOBS_SUBDIR = "blobs"  # Content-addressed attachment files: blobs/<sha256[:2]>/<sha256><ext>
+ATTACHMENT_INDEX_FILENAME = "attachments.db"  # Attachment id -> blob reference table, inside ATTACHMENTS_DIR
+STREAM_FULL_ARCHIVES = True  # Write /archive_messages output incrementally as NDJSON (False = single JSON file)
+ARCHIVE_CHECKPOINTS_FILE = "archive_checkpoints.json"  # Per-channel high-water marks for /archive_messages
+ARCHIVE_CHECKPOINT_EVERY = 100  # Persist the archive checkpoint after this many messages
+ARCHIVE_PART_SUFFIX = ".part"  # Side file a resumed compressed archive collects new messages in
+ARCHIVE_MAX_PENDING_RECORDS = 1000  # Messages allowed to wait on attachment downloads before extraction pauses
+REFERENCE_ARCHIVE_MAP_SIZE = 10000  # Already-archived messages kept around to resolve replies/forwards without a fetch
+REFERENCE_CACHE_SIZE = 1000  # Fetched referenced messages kept in the LRU cache
+REFERENCE_FETCH_CONCURRENCY = 2  # Referenced-message fetches allowed in flight at once
+
+# Attachment download pool
+ATTACHMENT_DOWNLOAD_CONCURRENCY = int(os.getenv("ATTACHMENT_DOWNLOAD_CONCURRENCY", "8"))  # Parallel downloads overall
+ATTACHMENT_PER_HOST_LIMIT = int(os.getenv("ATTACHMENT_PER_HOST_LIMIT", "4"))  # Parallel downloads per CDN host
+ATTACHMENT_DOWNLOAD_TIMEOUT = 20.0  # Seconds allowed per attachment
+
+# Shared HTTP client (connection pool reused by every download)
+HTTP_POOL_SIZE = 32  # Total open connections
+HTTP_KEEPALIVE_SECONDS = 60  # Keep idle CDN connections around between downloads
+HTTP_DNS_CACHE_SECONDS = 300
+
+# Blocking disk I/O and JSON encoding run here instead of on the event loop
+IO_WORKER_THREADS = int(os.getenv("IO_WORKER_THREADS", "4"))
+ATTACHMENT_WRITE_BUFFER = 1024 * 1024  # Bytes of a download buffered before handing them to an I/O thread
+
+# Thumbnails/previews for downloaded images (needs Pillow), made in worker processes
+GENERATE_THUMBNAILS = True
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Metrics endpoint: Prometheus text at /metrics, JSON at /metrics.json (METRICS_PORT=0 disables it)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Keep it local; scrape through a tunnel or a local Prometheus
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9321"))
+EVENT_LOOP_LAG_INTERVAL = 0.5  # Seconds between event-loop lag samples
 
 # Pin saving configuration - only save pins from these servers (comma-separated list)
 PINS_ENABLED_SERVER_IDS = []
 if os.getenv("PINS_ENABLED_SERVER_IDS"):
     PINS_ENABLED_SERVER_IDS = [int(x.strip()) for x in os.getenv("PINS_ENABLED_SERVER_IDS").split(",")]
 
-# Dictionary to store scheduled resets: {channel_name: [{'hour': X, 'minute': Y, 'type': 'text/voice', 'category': 'category_name', 'last_reset': 'YYYY-MM-DD-HH:MM'}]}
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKER_THREADS, thread_name_prefix="resploot-io")
+archive_checkpoints_lock = threading.Lock()  # Serializes read-modify-write of ARCHIVE_CHECKPOINTS_FILE
+
+thumbnail_executor = None  # Created on first use
+derivative_tasks = set()  # Thumbnail jobs still running (kept referenced until done)
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking function in the I/O thread pool so the gateway heartbeat keeps running"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+# Dictionary to store scheduled resets: {channel_name: [{'id': row_id, 'hour': X, 'minute': Y, 'type': 'text/voice', 'category': 'category_name', 'last_reset': 'YYYY-MM-DD-HH:MM'}]}
 scheduled_resets = {}
 
-def load_schedules():
-    """Load scheduled resets from file"""
-    global scheduled_resets
+# Recent scheduled reset latencies (start/finish delay vs. scheduled time), newest last
+reset_timings = collections.deque(maxlen=200)
+
+# Metrics (see bot_metrics.py); delays are relative to the scheduled reset time
+RESET_DELAY_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+RESET_START_DELAY = bot_metrics.REGISTRY.histogram(
+    "resploot_reset_start_delay_seconds", "Scheduled reset start time minus scheduled time", buckets=RESET_DELAY_BUCKETS)
+RESET_FINISH_DELAY = bot_metrics.REGISTRY.histogram(
+    "resploot_reset_finish_delay_seconds", "Scheduled reset finish time minus scheduled time", buckets=RESET_DELAY_BUCKETS)
+RESETS = bot_metrics.REGISTRY.counter("resploot_resets_total", "Scheduled resets run", ["outcome"])
+RESET_PHASE_SECONDS = bot_metrics.REGISTRY.histogram(
+    "resploot_reset_phase_seconds", "Time spent in each phase of a channel reset", ["phase"], buckets=RESET_DELAY_BUCKETS)
+ARCHIVE_MESSAGES = bot_metrics.REGISTRY.counter("resploot_archive_messages_total", "Messages written to full-channel archives")
+ARCHIVE_BYTES = bot_metrics.REGISTRY.counter("resploot_archive_bytes_total", "Bytes added to full-channel archive files")
+ARCHIVE_DURATION = bot_metrics.REGISTRY.histogram(
+    "resploot_archive_duration_seconds", "Duration of full-channel archive runs", buckets=RESET_DELAY_BUCKETS)
+ARCHIVE_RATE = bot_metrics.REGISTRY.gauge(
+    "resploot_archive_last_messages_per_second", "Throughput of the most recent full-channel archive run")
+ATTACHMENT_BYTES = bot_metrics.REGISTRY.counter("resploot_attachment_bytes_total", "Attachment bytes downloaded")
+ATTACHMENT_DOWNLOADS = bot_metrics.REGISTRY.counter(
+    "resploot_attachment_downloads_total", "Attachments handled by the download pool", ["outcome"])
+RATE_LIMITED = bot_metrics.REGISTRY.counter(
+    "resploot_discord_rate_limited_total", "429 responses from the Discord REST API", ["method", "route"])
+RATE_LIMITED_GLOBAL = bot_metrics.REGISTRY.counter(
+    "resploot_discord_global_rate_limited_total", "Of those 429s, how many were global rate limits")
+RATE_LIMIT_WAIT = bot_metrics.REGISTRY.counter(
+    "resploot_discord_rate_limit_wait_seconds_total", "Seconds discord.py slept on 429 responses before retrying")
+EVENT_LOOP_LAG = bot_metrics.REGISTRY.histogram("resploot_event_loop_lag_seconds", "How late the event loop ran a timed wakeup")
+EVENT_LOOP_LAG_LAST = bot_metrics.REGISTRY.gauge("resploot_event_loop_lag_last_seconds", "Most recent event-loop lag sample")
+
+# discord.py retries 429s on its own; its warnings are the only trace of them
+logging.getLogger("discord.http").addHandler(bot_metrics.RateLimitLogHandler(RATE_LIMITED, RATE_LIMIT_WAIT, RATE_LIMITED_GLOBAL))
+
+@contextmanager
+def reset_phase(phase, phase_times=None):
+    """Time one phase of a channel reset, adding it to phase_times (if given) as well"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        RESET_PHASE_SECONDS.observe(elapsed, phase=phase)
+        if phase_times is not None:
+            phase_times[phase] = phase_times.get(phase, 0.0) + elapsed
+
+@contextmanager
+def open_schedule_store():
+    """Open the schedule database in a transaction, creating it (and importing schedules.json) if needed"""
+    conn = sqlite3.connect(SCHEDULES_DB, timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        with conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS schedules (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        channel_name TEXT NOT NULL,
+                        type TEXT NOT NULL,
+                        hour INTEGER NOT NULL,
+                        minute INTEGER NOT NULL,
+                        category TEXT,
+                        last_reset TEXT
+                    );
+                    CREATE INDEX IF NOT EXISTS schedules_by_channel ON schedules (channel_name, id);
+                """)
+                _import_legacy_schedules(conn)
+                conn.execute("PRAGMA user_version = 1")
+            yield conn
+    finally:
+        conn.close()
+
+def _import_legacy_schedules(conn):
+    """One-time import of schedules.json (either format) into a new schedule database"""
     try:
         with open(SCHEDULES_FILE, 'r') as f:
             data = json.load(f)
-        
-        # Migrate old format to new format if needed
-        migrated = {}
-        for channel_name, schedule_data in data.items():
-            if isinstance(schedule_data, dict) and 'hour' in schedule_data:
-                # Old format: single schedule per channel
-                migrated[channel_name] = [schedule_data]
-            elif isinstance(schedule_data, list):
-                # New format: list of schedules per channel
-                migrated[channel_name] = schedule_data
-            else:
-                # Invalid format, skip
-                print(f"Skipping invalid schedule data for {channel_name}")
-                continue
-        
-        scheduled_resets = migrated
-        total_schedules = sum(len(schedules) for schedules in scheduled_resets.values())
-        print(f"Loaded {total_schedules} scheduled resets across {len(scheduled_resets)} channels")
-        
     except FileNotFoundError:
-        scheduled_resets = {}
-        print("No schedules file found, starting with empty schedules")
+        return
+    except json.JSONDecodeError:
+        print(f"Invalid {SCHEDULES_FILE}, not importing it")
+        return
+    
+    imported = 0
+    for channel_name, schedule_data in data.items():
+        if isinstance(schedule_data, dict) and 'hour' in schedule_data:
+            # Old format: single schedule per channel
+            schedule_list = [schedule_data]
+        elif isinstance(schedule_data, list):
+            # New format: list of schedules per channel
+            schedule_list = schedule_data
+        else:
+            # Invalid format, skip
+            print(f"Skipping invalid schedule data for {channel_name}")
+            continue
+        for schedule in schedule_list:
+            _insert_schedule(conn, channel_name, schedule)
+            imported += 1
+    print(f"Imported {imported} scheduled resets from {SCHEDULES_FILE} into {SCHEDULES_DB}")
+
+def _insert_schedule(conn, channel_name, schedule):
+    cursor = conn.execute(
+        "INSERT INTO schedules (channel_name, type, hour, minute, category, last_reset) VALUES (?, ?, ?, ?, ?, ?)",
+        (channel_name, schedule.get('type', 'text'), schedule['hour'], schedule['minute'],
+         schedule.get('category'), schedule.get('last_reset'))
+    )
+    return cursor.lastrowid
+
+def load_schedules():
+    """Load scheduled resets from the schedule database"""
+    global scheduled_resets
+    try:
+        with open_schedule_store() as conn:
+            rows = conn.execute("SELECT * FROM schedules ORDER BY channel_name, id").fetchall()
+    except sqlite3.Error as e:
+        print(f"Error loading schedules: {e}")
+        return
+    
+    loaded = {}
+    for row in rows:
+        loaded.setdefault(row['channel_name'], []).append({
+            'id': row['id'],
+            'type': row['type'],
+            'hour': row['hour'],
+            'minute': row['minute'],
+            'category': row['category'],
+            'last_reset': row['last_reset']
+        })
+    scheduled_resets = loaded
+    total_schedules = sum(len(schedules) for schedules in scheduled_resets.values())
+    print(f"Loaded {total_schedules} scheduled resets across {len(scheduled_resets)} channels")
+
+def add_schedule(channel_name, schedule):
+    """Insert a schedule and record its row id on the schedule dict"""
+    with open_schedule_store() as conn:
+        schedule['id'] = _insert_schedule(conn, channel_name, schedule)
+
+def remove_schedules(schedule_ids):
+    """Delete schedules by row id"""
+    with open_schedule_store() as conn:
+        conn.executemany("DELETE FROM schedules WHERE id = ?", [(schedule_id,) for schedule_id in schedule_ids])
+
+def update_last_reset(schedule_ids, last_reset):
+    """Record the last completed reset of one or more schedules"""
+    with open_schedule_store() as conn:
+        conn.executemany(
+            "UPDATE schedules SET last_reset = ? WHERE id = ?",
+            [(last_reset, schedule_id) for schedule_id in schedule_ids]
+        )
+
+def _write_text_file(file_path, text):
+    """Replace a small text file atomically (via a uniquely named temp file, so concurrent writers can't collide)"""
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(file_path) or '.',
+                                     prefix=f"{os.path.basename(file_path)}.", suffix=".tmp", delete=False) as f:
+        f.write(text)
+    try:
+        os.replace(f.name, file_path)
+    except BaseException:
+        os.remove(f.name)
+        raise
+
+def load_archive_checkpoints():
+    """Load per-channel archive checkpoints: {channel_id: {'last_message_id', 'archive_file', 'updated_at'}}"""
+    try:
+        with open(ARCHIVE_CHECKPOINTS_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
     except json.JSONDecodeError:
-        scheduled_resets = {}
-        print("Invalid schedules file, starting with empty schedules")
+        print("Invalid archive checkpoints file, starting from scratch")
+        return {}
+
+def save_archive_checkpoint(channel_id, last_message_id, archive_file):
+    """Record how far a channel has been archived (atomic replace of the checkpoints file)"""
+    # Runs in the I/O pool; archives of other channels update the same file concurrently
+    with archive_checkpoints_lock:
+        checkpoints = load_archive_checkpoints()
+        checkpoints[str(channel_id)] = {
+            "last_message_id": last_message_id,
+            "archive_file": archive_file,
+            "updated_at": datetime.datetime.now().isoformat()
+        }
+        try:
+            _write_text_file(ARCHIVE_CHECKPOINTS_FILE, json.dumps(checkpoints, indent=2))
+        except Exception as e:
+            print(f"Error saving archive checkpoint: {e}")
 
-def save_schedules():
-    """Save scheduled resets to file"""
+def update_archive_index(filepath):
+    """Add a freshly written archive to the viewer's catalog and search index"""
     try:
-        with open(SCHEDULES_FILE, 'w') as f:
-            json.dump(scheduled_resets, f, indent=2)
+        archive_catalog.index_archive(filepath)
     except Exception as e:
-        print(f"Error saving schedules: {e}")
+        # The viewer re-indexes changed files on its own, so this is not fatal
+        print(f"Error indexing {filepath} for search: {e}")
+
+@contextmanager
+def open_attachment_index():
+    """Open the attachment reference table (attachment id -> content-addressed blob)"""
+    os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(ATTACHMENTS_DIR, ATTACHMENT_INDEX_FILENAME), timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                local_filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                content_type TEXT,
+                first_seen TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS attachment_refs (
+                attachment_id INTEGER PRIMARY KEY,
+                sha256 TEXT NOT NULL REFERENCES blobs (sha256),
+                filename TEXT,
+                url TEXT,
+                recorded_at TEXT NOT NULL
+            );
+        """)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def lookup_attachment_blob(attachment_id):
+    """Return (sha256, local_filename) for an attachment we already hold, else None"""
+    with open_attachment_index() as conn:
+        row = conn.execute(
+            """
+            SELECT b.sha256, b.local_filename FROM attachment_refs r
+            JOIN blobs b ON b.sha256 = r.sha256
+            WHERE r.attachment_id = ?
+            """,
+            (attachment_id,)
+        ).fetchone()
+    if row and os.path.exists(os.path.join(ATTACHMENTS_DIR, row[1])):
+        return row
+    return None
 
-async def download_attachment(session, attachment, timestamp, guild_id):
-    """Download an attachment and save it locally"""
+def record_attachment_blob(attachment, sha256, local_filename, size):
+    """Remember which blob an attachment id resolved to"""
+    now = datetime.datetime.now().isoformat()
+    with open_attachment_index() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (sha256, local_filename, size, content_type, first_seen) VALUES (?, ?, ?, ?, ?)",
+            (sha256, local_filename, size, attachment.content_type, now)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO attachment_refs (attachment_id, sha256, filename, url, recorded_at) VALUES (?, ?, ?, ?, ?)",
+            (attachment.id, sha256, attachment.filename, attachment.url, now)
+        )
+
+def blob_filename(sha256, original_filename):
+    """Content-addressed path (relative to ATTACHMENTS_DIR), keeping the extension for MIME detection"""
+    extension = os.path.splitext(original_filename)[1].lower()
+    return f"{ATTACHMENT_BLOBS_SUBDIR}/{sha256[:2]}/{sha256}{extension}"
+
+def _stored_attachment_info(attachment, sha256, local_filename):
+    """Archive record for an attachment that is available locally"""
+    return {
+        "filename": attachment.filename,
+        "local_path": os.path.join(ATTACHMENTS_DIR, local_filename),
+        "local_filename": local_filename,
+        "sha256": sha256,
+        "url": attachment.url,
+        "original_url": attachment.url,
+        "size": attachment.size,
+        "content_type": attachment.content_type,
+        "downloaded": True
+    }
+
+async def make_attachment_derivatives(attachment, local_filename):
+    """Make the thumbnail and preview of a stored image attachment, if missing.
+
+    Runs as a background task (see schedule_attachment_derivatives); the
+    resizing itself happens in the thumbnail process pool.
+    """
+    global thumbnail_executor
+    if not GENERATE_THUMBNAILS or not thumbnails.available() or not thumbnails.is_image(attachment.filename, attachment.content_type):
+        return
+    
     try:
-        # Create attachments directory if it doesn't exist
-        os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+        if await run_io(thumbnails.existing_derivatives, ATTACHMENTS_DIR, local_filename):
+            return
         
-        # Parse the URL to get file extension
-        parsed_url = urlparse(attachment.url)
+        if thumbnail_executor is None:
+            # Not fork: by now the process has I/O threads, sqlite and aiohttp running,
+            # and a forked child can deadlock on a lock one of them held
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            thumbnail_executor = ProcessPoolExecutor(
+                max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context(start_method)
+            )
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(thumbnail_executor, thumbnails.generate_derivatives, os.path.abspath(ATTACHMENTS_DIR), local_filename)
+    except Exception as e:
+        print(f"Error making thumbnails for {attachment.filename}: {e}")
+
+def schedule_attachment_derivatives(attachment, local_filename):
+    """Make an image attachment's thumbnail and preview in the background.
+
+    Neither the download pool nor the archive record waits for them; the
+    viewer finds derivatives on disk by the blob's name.
+    """
+    if not GENERATE_THUMBNAILS or not thumbnails.available() or not thumbnails.is_image(attachment.filename, attachment.content_type):
+        return
+    task = asyncio.create_task(make_attachment_derivatives(attachment, local_filename))
+    derivative_tasks.add(task)
+    task.add_done_callback(derivative_tasks.discard)
+
+def _create_download_temp_file(attachment_id):
+    """Create the temporary file a download is streamed into"""
+    temp_dir = os.path.join(ATTACHMENTS_DIR, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=temp_dir, prefix=f"{attachment_id}_", suffix=".part")
+
+def _write_download_chunks(f, digest, chunks):
+    """Hash and write a batch of downloaded chunks"""
+    for chunk in chunks:
+        digest.update(chunk)
+        f.write(chunk)
+
+def _store_download(temp_path, local_path):
+    """Move a finished download into the blob store; False if the blob already existed"""
+    if os.path.exists(local_path):
+        return False
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    os.replace(temp_path, local_path)
+    return True
+
+async def download_attachment(session, attachment, guild_id):
+    """Download an attachment into the content-addressed store.
+
+    Attachments whose id is already in the reference table are not fetched
+    again, and identical bytes downloaded under different ids share one blob.
+    """
+    try:
         original_filename = attachment.filename
         
-        # Create a safe filename with timestamp to avoid collisions
-        safe_filename = f"{timestamp}_{attachment.id}_{original_filename}"
-        local_path = os.path.join(ATTACHMENTS_DIR, safe_filename)
+        known = await run_io(lookup_attachment_blob, attachment.id)
+        if known:
+            sha256, local_filename = known
+            print(f"Attachment already stored: {original_filename} -> {local_filename}")
+            return _stored_attachment_info(attachment, sha256, local_filename)
         
-        # Download the file
-        async with session.get(attachment.url) as response:
-            if response.status == 200:
-                with open(local_path, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(8192):
-                        f.write(chunk)
-                
-                print(f"Downloaded attachment: {safe_filename}")
-                return {
-                    "filename": original_filename,
-                    "local_path": local_path,
-                    "local_filename": safe_filename,
-                    "url": attachment.url,
-                    "original_url": attachment.url,
-                    "size": attachment.size,
-                    "content_type": attachment.content_type,
-                    "downloaded": True
-                }
+        # Download to a temporary file, hashing as the bytes arrive; hashing
+        # and writing happen in the I/O pool, a buffer's worth at a time
+        temp_fd, temp_path = await run_io(_create_download_temp_file, attachment.id)
+        
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with open(temp_fd, 'wb') as f:
+                async with session.get(attachment.url) as response:
+                    if response.status != 200:
+                        print(f"Failed to download attachment {original_filename}: HTTP {response.status}")
+                        return _failed_attachment_info(attachment, f"HTTP {response.status}")
+                    
+                    buffer = []
+                    buffered = 0
+                    async for chunk in response.content.iter_chunked(65536):
+                        buffer.append(chunk)
+                        buffered += len(chunk)
+                        if buffered >= ATTACHMENT_WRITE_BUFFER:
+                            await run_io(_write_download_chunks, f, digest, buffer)
+                            size += buffered
+                            buffer = []
+                            buffered = 0
+                    await run_io(_write_download_chunks, f, digest, buffer)
+                    size += buffered
+            ATTACHMENT_BYTES.inc(size)
+            
+            sha256 = digest.hexdigest()
+            local_filename = blob_filename(sha256, original_filename)
+            if await run_io(_store_download, temp_path, os.path.join(ATTACHMENTS_DIR, local_filename)):
+                print(f"Downloaded attachment: {local_filename}")
             else:
-                print(f"Failed to download attachment {original_filename}: HTTP {response.status}")
-                return {
-                    "filename": original_filename,
-                    "url": attachment.url,
-                    "original_url": attachment.url,
-                    "size": attachment.size,
-                    "content_type": attachment.content_type,
-                    "downloaded": False,
-                    "error": f"HTTP {response.status}"
-                }
+                print(f"Attachment deduplicated: {original_filename} -> {local_filename}")
+        finally:
+            if os.path.exists(temp_path):
+                await run_io(os.remove, temp_path)
+        
+        await run_io(record_attachment_blob, attachment, sha256, local_filename, size)
+        return _stored_attachment_info(attachment, sha256, local_filename)
                 
     except Exception as e:
         print(f"Error downloading attachment {attachment.filename}: {e}")
-        return {
-            "filename": attachment.filename,
-            "url": attachment.url,
-            "original_url": attachment.url,
-            "size": attachment.size,
-            "content_type": attachment.content_type,
-            "downloaded": False,
-            "error": str(e)
-        }
+        return _failed_attachment_info(attachment, str(e))
+
+def _failed_attachment_info(attachment, error):
+    """Archive record for an attachment that could not be downloaded"""
+    return {
+        "filename": attachment.filename,
+        "url": attachment.url,
+        "original_url": attachment.url,
+        "size": attachment.size,
+        "content_type": attachment.content_type,
+        "downloaded": False,
+        "error": error
+    }
+
+class AttachmentDownloader:
+    """Bounded pool of download workers fed by an asyncio queue.
+
+    submit() hands back a future per attachment so message extraction can
+    keep going while files download in the background. A global worker
+    count and a per-host cap keep a single CDN host from being hammered.
+    Downloads go through the bot's shared, pooled HTTP session.
+    """
+
+    def __init__(self, guild_id, concurrency=None, per_host_limit=None):
+        self.guild_id = guild_id
+        self.concurrency = concurrency or ATTACHMENT_DOWNLOAD_CONCURRENCY
+        self.per_host_limit = per_host_limit or ATTACHMENT_PER_HOST_LIMIT
+        # Bounded so a flood of attachments pauses extraction instead of piling up
+        self.queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        self._host_semaphores = {}
+        self._submitted = {}
+        self._workers = []
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = bot.get_http_session()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.queue.join()
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            # Anything still queued (after an error) will never be downloaded
+            while not self.queue.empty():
+                attachment, future = self.queue.get_nowait()
+                if not future.done():
+                    future.set_result(_failed_attachment_info(attachment, "Download cancelled"))
+
+    async def submit(self, attachment):
+        """Queue an attachment for download and return a future for its archive record"""
+        # The same attachment can show up more than once (e.g. forwards); fetch it once
+        if attachment.id in self._submitted:
+            return self._submitted[attachment.id]
+        future = asyncio.get_running_loop().create_future()
+        self._submitted[attachment.id] = future
+        await self.queue.put((attachment, future))
+        return future
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).hostname or ""
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def _worker(self):
+        while True:
+            attachment, future = await self.queue.get()
+            try:
+                async with self._host_semaphore(attachment.url):
+                    # Download with individual timeout per attachment
+                    info = await asyncio.wait_for(
+                        download_attachment(self._session, attachment, self.guild_id),
+                        timeout=ATTACHMENT_DOWNLOAD_TIMEOUT
+                    )
+                ATTACHMENT_DOWNLOADS.inc(outcome="stored" if info.get("downloaded") else "failed")
+                if info.get("downloaded"):
+                    print(f"  ✓ Downloaded: {attachment.filename}")
+                    schedule_attachment_derivatives(attachment, info["local_filename"])
+            except asyncio.TimeoutError:
+                print(f"  ⚠ Timeout downloading {attachment.filename}, continuing...")
+                ATTACHMENT_DOWNLOADS.inc(outcome="timeout")
+                info = _failed_attachment_info(attachment, "Download timeout")
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.set_result(_failed_attachment_info(attachment, "Download cancelled"))
+                raise
+            except Exception as e:
+                print(f"  ✗ Error downloading {attachment.filename}: {e}")
+                ATTACHMENT_DOWNLOADS.inc(outcome="failed")
+                info = _failed_attachment_info(attachment, str(e))
+            finally:
+                self.queue.task_done()
+            if not future.done():
+                future.set_result(info)
+
+async def submit_attachments(downloader, attachments):
+    """Queue all attachments of a message, returning their futures in order"""
+    return [await downloader.submit(att) for att in attachments]
 
 async def save_pins_to_json(channel_name, pins, guild):
     """Save pinned messages to JSON file"""
@@ -147,10 +673,9 @@ async def save_pins_to_json(channel_name, pins, guild):
             "pins": []
         }
         
-        # Extract data from each pin and download attachments
-        async with aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=30, connect=10)  # 30s total, 10s connect timeout
-        ) as session:
+        # Extract data from each pin; attachments download concurrently in the background
+        async with AttachmentDownloader(guild.id) as downloader:
+            pending = []
             for pin in reversed(pins):  # Reverse to keep chronological order
                 try:
                     # Debug: Print pin information
@@ -160,42 +685,7 @@ async def save_pins_to_json(channel_name, pins, guild):
                     print(f"  Attachments: {len(pin.attachments)}")
                     print(f"  Embeds: {len(pin.embeds)}")
                     
-                    # Download attachments with robust error handling
-                    attachment_data = []
-                    if pin.attachments:
-                        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                        for att in pin.attachments:
-                            print(f"  Downloading attachment: {att.filename}")
-                            try:
-                                # Download with individual timeout per attachment
-                                attachment_info = await asyncio.wait_for(
-                                    download_attachment(session, att, timestamp, guild.id),
-                                    timeout=20.0  # 20 second timeout per attachment
-                                )
-                                attachment_data.append(attachment_info)
-                                print(f"  ✓ Downloaded: {att.filename}")
-                            except asyncio.TimeoutError:
-                                print(f"  ⚠ Timeout downloading {att.filename}, continuing...")
-                                attachment_data.append({
-                                    "filename": att.filename,
-                                    "url": att.url,
-                                    "original_url": att.url,
-                                    "size": att.size,
-                                    "content_type": att.content_type,
-                                    "downloaded": False,
-                                    "error": "Download timeout"
-                                })
-                            except Exception as e:
-                                print(f"  ✗ Error downloading {att.filename}: {e}")
-                                attachment_data.append({
-                                    "filename": att.filename,
-                                    "url": att.url,
-                                    "original_url": att.url,
-                                    "size": att.size,
-                                    "content_type": att.content_type,
-                                    "downloaded": False,
-                                    "error": str(e)
-                                })
+                    attachment_futures = await submit_attachments(downloader, pin.attachments)
                     
                     pin_data = {
                         "id": pin.id,
@@ -208,7 +698,7 @@ async def save_pins_to_json(channel_name, pins, guild):
                         "content": pin.content,
                         "created_at": pin.created_at.isoformat(),
                         "jump_url": pin.jump_url,
-                        "attachments": attachment_data,
+                        "attachments": [],
                         "embeds": [embed.to_dict() for embed in pin.embeds] if pin.embeds else [],
                         "reactions": [
                             {
@@ -223,256 +713,360 @@ async def save_pins_to_json(channel_name, pins, guild):
                         } if pin.reference else None,
                         "type": str(pin.type) if hasattr(pin, 'type') else None
                     }
-                    pins_data["pins"].append(pin_data)
+                    pending.append((pin_data, attachment_futures))
                 except Exception as e:
                     print(f"Error processing pin {pin.id}: {e}")
+            
+            # Merge download results back into the pin records
+            for pin_data, attachment_futures in pending:
+                pin_data["attachments"] = list(await asyncio.gather(*attachment_futures))
+                pins_data["pins"].append(pin_data)
         
         # Save to file with timestamp in filename
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{channel_name}_{timestamp}.json"
+        filename = f"{channel_name}_{timestamp}{JSON_EXTENSION}{compression_suffix()}"
         filepath = os.path.join(PINS_DATA_DIR, filename)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(pins_data, f, indent=2, ensure_ascii=False)
+        await run_io(write_json_document, filepath, pins_data)
         
         print(f"Saved {len(pins)} pins to {filepath}")
+        await run_io(update_archive_index, filepath)
         return filepath
         
     except Exception as e:
         print(f"Error saving pins to JSON: {e}")
         return None
 
-async def save_all_messages_to_json(channel, guild, limit=None):
-    """Save all messages from a channel to JSON file"""
+def _author_info(author):
+    """Archive record for a message author"""
+    return {
+        "name": author.display_name,
+        "username": str(author),
+        "id": author.id,
+        "avatar_url": str(author.display_avatar.url) if author.display_avatar else None
+    }
+
+class MessageReferenceResolver:
+    """Resolves replied-to and forwarded messages while archiving a channel.
+
+    Lookups go, in order, through the records already built in this
+    (oldest-first) pass, an LRU of messages fetched earlier, and any fetch
+    already in flight for the same id; only then is a REST fetch made, with
+    at most REFERENCE_FETCH_CONCURRENCY running at once. Misses (deleted or
+    inaccessible messages) are cached too, so they are not retried.
+    """
+
+    def __init__(self):
+        # message id -> (record, attachment_futures) for messages in this archive
+        self._archived = collections.OrderedDict()
+        # message id -> fetched discord.Message, or None for a cached miss
+        self._fetched = collections.OrderedDict()
+        self._in_flight = {}
+        self._fetch_slots = asyncio.Semaphore(REFERENCE_FETCH_CONCURRENCY)
+        self.archive_hits = 0
+        self.cache_hits = 0
+        self.fetches = 0
+
+    def remember(self, record, attachment_futures):
+        """Make an archived record available to later replies/forwards"""
+        self._archived[record["id"]] = (record, attachment_futures)
+        if len(self._archived) > REFERENCE_ARCHIVE_MAP_SIZE:
+            self._archived.popitem(last=False)
+
+    def archived(self, message_id):
+        """Return (record, attachment_futures) if the message is already in this archive"""
+        entry = self._archived.get(message_id)
+        if entry:
+            self.archive_hits += 1
+        return entry
+
+    async def fetch(self, reference):
+        """Return the referenced discord.Message, or None if it can't be fetched"""
+        message_id = reference.message_id
+        if message_id in self._fetched:
+            self._fetched.move_to_end(message_id)
+            self.cache_hits += 1
+            return self._fetched[message_id]
+        
+        # Several messages replying to the same one share a single fetch
+        if message_id not in self._in_flight:
+            self._in_flight[message_id] = asyncio.ensure_future(self._fetch(reference))
+        try:
+            return await asyncio.shield(self._in_flight[message_id])
+        finally:
+            self._in_flight.pop(message_id, None)
+
+    async def _fetch(self, reference):
+        message = None
+        original_channel = bot.get_channel(reference.channel_id)
+        if original_channel:
+            async with self._fetch_slots:
+                self.fetches += 1
+                try:
+                    message = await original_channel.fetch_message(reference.message_id)
+                except Exception as e:
+                    print(f"  ⚠ Could not fetch referenced message {reference.message_id}: {e}")
+        
+        self._fetched[reference.message_id] = message
+        if len(self._fetched) > REFERENCE_CACHE_SIZE:
+            self._fetched.popitem(last=False)
+        return message
+
+async def build_message_record(message, downloader, resolver):
+    """Convert one channel message into an archive record.
+
+    Returns (record, attachment_futures); the record's attachments list is
+    filled in from the futures once their downloads finish.
+    """
+    # Handle forwarded messages and replies by resolving the original message
+    original_message = None
+    original_record = None
+    if message.reference and message.reference.message_id:
+        original_record = resolver.archived(message.reference.message_id)
+        if not original_record:
+            original_message = await resolver.fetch(message.reference)
+            if original_message:
+                print(f"  📨 Found original message for forward: {original_message.id}")
+    
+    # Use original message content if this is a forward with no content
+    use_original = (original_message or original_record) and not message.content and not message.attachments
+    
+    if use_original and original_record:
+        # Already archived in this run: reuse its content and attachment downloads
+        source_record, attachment_futures = original_record
+        content = source_record["content"]
+        embeds = source_record["embeds"]
+    else:
+        display_message = original_message if use_original else message
+        content = display_message.content
+        embeds = [embed.to_dict() for embed in display_message.embeds] if display_message.embeds else []
+        # Attachments are downloaded by the worker pool; the caller merges the results
+        attachment_futures = await submit_attachments(downloader, display_message.attachments)
+    
+    if original_record:
+        original_author = original_record[0]["author"]
+    elif original_message:
+        original_author = _author_info(original_message.author)
+    else:
+        original_author = None
+    
+    record = {
+        "id": message.id,
+        "author": _author_info(message.author),
+        "content": content,
+        "created_at": message.created_at.isoformat(),
+        "jump_url": message.jump_url,
+        "is_pinned": message.pinned,
+        "attachments": [],
+        "embeds": embeds,
+        "reactions": [
+            {
+                "emoji": str(reaction.emoji),
+                "count": reaction.count
+            }
+            for reaction in message.reactions
+        ] if message.reactions else [],
+        "message_reference": {
+            "message_id": message.reference.message_id,
+            "channel_id": message.reference.channel_id,
+            "guild_id": message.reference.guild_id
+        } if message.reference else None,
+        "type": str(message.type) if hasattr(message, 'type') else None,
+        "original_author": original_author
+    }
+    resolver.remember(record, attachment_futures)
+    return record, attachment_futures
+
+@dataclass
+class ArchiveResult:
+    """What a full-channel archive run produced"""
+    filepath: str
+    message_count: int
+    bytes_written: int
+    attachments_downloaded: int
+    attachments_failed: int
+    elapsed_seconds: float
+    
+    @property
+    def messages_per_second(self):
+        return self.message_count / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+async def save_all_messages_to_json(channel, guild, limit=None, resume=True):
+    """Save all messages from a channel to an archive file.
+
+    With STREAM_FULL_ARCHIVES each message is appended to an NDJSON file as
+    soon as it is processed, so memory stays flat and an interrupted run
+    still leaves a readable archive behind. A per-channel checkpoint records
+    the last archived message id; with ``resume`` a repeat (or interrupted)
+    archive only fetches newer messages and appends them to the same file.
+    Returns an ArchiveResult for this run, or None if archiving failed.
+    """
+    started = time.monotonic()
     try:
         # Create pins data directory if it doesn't exist
         os.makedirs(PINS_DATA_DIR, exist_ok=True)
         
-        print(f"Starting full archive of #{channel.name}...")
-        
-        # Collect all messages
-        messages = []
-        message_count = 0
-        
-        async for message in channel.history(limit=limit, oldest_first=True):
-            message_count += 1
-            if message_count % 100 == 0:
-                print(f"  Processed {message_count} messages...")
-            
-            # Process message data similar to pins but for all messages
-            try:
-                # Handle forwarded messages by fetching original content
-                original_message = None
-                if message.reference and message.reference.message_id:
-                    try:
-                        # Try to fetch the original message
-                        original_channel = bot.get_channel(message.reference.channel_id)
-                        if original_channel:
-                            original_message = await original_channel.fetch_message(message.reference.message_id)
-                            print(f"  📨 Found original message for forward: {original_message.id}")
-                    except Exception as e:
-                        print(f"  ⚠ Could not fetch referenced message {message.reference.message_id}: {e}")
-                
-                # Use original message content if this is a forward with no content
-                display_message = original_message if (original_message and not message.content and not message.attachments) else message
-                
-                # Download attachments with robust error handling
-                attachment_data = []
-                if display_message.attachments:
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    async with aiohttp.ClientSession(
-                        timeout=aiohttp.ClientTimeout(total=30, connect=10)
-                    ) as session:
-                        for att in display_message.attachments:
-                            try:
-                                # Download with individual timeout per attachment
-                                attachment_info = await asyncio.wait_for(
-                                    download_attachment(session, att, timestamp, guild.id),
-                                    timeout=20.0  # 20 second timeout per attachment
-                                )
-                                attachment_data.append(attachment_info)
-                                print(f"  ✓ Downloaded: {att.filename}")
-                            except asyncio.TimeoutError:
-                                print(f"  ⚠ Timeout downloading {att.filename}")
-                                attachment_data.append({
-                                    "filename": att.filename,
-                                    "url": att.url,
-                                    "original_url": att.url,
-                                    "size": att.size,
-                                    "content_type": att.content_type,
-                                    "downloaded": False,
-                                    "error": "Download timeout"
-                                })
-                            except Exception as e:
-                                print(f"  ✗ Error downloading {att.filename}: {e}")
-                                attachment_data.append({
-                                    "filename": att.filename,
-                                    "url": att.url,
-                                    "original_url": att.url,
-                                    "size": att.size,
-                                    "content_type": att.content_type,
-                                    "downloaded": False,
-                                    "error": str(e)
-                                })
-                
-                message_data = {
-                    "id": message.id,
-                    "author": {
-                        "name": message.author.display_name,
-                        "username": str(message.author),
-                        "id": message.author.id,
-                        "avatar_url": str(message.author.display_avatar.url) if message.author.display_avatar else None
-                    },
-                    "content": display_message.content,
-                    "created_at": message.created_at.isoformat(),
-                    "jump_url": message.jump_url,
-                    "is_pinned": message.pinned,
-                    "attachments": attachment_data,
-                    "embeds": [embed.to_dict() for embed in display_message.embeds] if display_message.embeds else [],
-                    "reactions": [
-                        {
-                            "emoji": str(reaction.emoji),
-                            "count": reaction.count
-                        }
-                        for reaction in message.reactions
-                    ] if message.reactions else [],
-                    "message_reference": {
-                        "message_id": message.reference.message_id,
-                        "channel_id": message.reference.channel_id,
-                        "guild_id": message.reference.guild_id
-                    } if message.reference else None,
-                    "type": str(message.type) if hasattr(message, 'type') else None,
-                    "original_author": {
-                        "name": original_message.author.display_name,
-                        "username": str(original_message.author),
-                        "id": original_message.author.id,
-                        "avatar_url": str(original_message.author.display_avatar.url) if original_message.author.display_avatar else None
-                    } if original_message else None
-                }
-                messages.append(message_data)
-                
-            except Exception as e:
-                print(f"Error processing message {message.id}: {e}")
-        
-        # Prepare archive data
-        archive_data = {
+        header = {
             "guild_id": guild.id,
             "guild_name": guild.name,
             "channel_name": channel.name,
             "archive_type": "full_messages",
-            "archive_timestamp": datetime.datetime.now().isoformat(),
-            "message_count": len(messages),
-            "messages": messages
+            "archive_timestamp": datetime.datetime.now().isoformat()
         }
         
-        # Save to file with timestamp in filename
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{channel.name}_FULL_{timestamp}.json"
+        # Pick up where the last archive of this channel stopped, if its file is still there
+        checkpoint = None
+        if STREAM_FULL_ARCHIVES and resume:
+            checkpoint = (await run_io(load_archive_checkpoints)).get(str(channel.id))
+            if checkpoint and not os.path.exists(os.path.join(PINS_DATA_DIR, checkpoint['archive_file'])):
+                print(f"Archive file {checkpoint['archive_file']} is gone, starting a new archive")
+                checkpoint = None
+        
+        # Name the file up front so streamed messages land in their final location
+        after = None
+        size_before = 0
+        append_to = None
+        if checkpoint:
+            filename = checkpoint['archive_file']
+            size_before = os.path.getsize(os.path.join(PINS_DATA_DIR, filename))
+            write_filename = filename
+            if is_compressed_filename(filename):
+                # Finished archives are compressed; this run's messages go to a plain
+                # side file that is appended to it as a new compressed member on close
+                append_to = os.path.join(PINS_DATA_DIR, filename)
+                write_filename = f"{strip_compression_suffix(filename)}{ARCHIVE_PART_SUFFIX}"
+            # Messages flushed after the last checkpoint are already in the file
+            last_id = checkpoint['last_message_id']
+            if os.path.exists(os.path.join(PINS_DATA_DIR, write_filename)):
+                last_id = max(last_id, await run_io(last_record_id, os.path.join(PINS_DATA_DIR, write_filename)) or 0)
+            after = discord.Object(id=last_id)
+            print(f"Resuming archive of #{channel.name} after message {last_id} into {filename}...")
+        else:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Streamed archives are compressed once they are closed, JSON ones are written compressed
+            extension = NDJSON_EXTENSION if STREAM_FULL_ARCHIVES else f"{JSON_EXTENSION}{compression_suffix()}"
+            filename = f"{channel.name}_FULL_{timestamp}{extension}"
+            write_filename = filename
+            print(f"Starting full archive of #{channel.name}...")
         filepath = os.path.join(PINS_DATA_DIR, filename)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(archive_data, f, indent=2, ensure_ascii=False)
+        if STREAM_FULL_ARCHIVES:
+            writer = await run_io(NdjsonArchiveWriter, os.path.join(PINS_DATA_DIR, write_filename), header, append_to=append_to)
+        else:
+            writer = JsonArchiveWriter(filepath, header)
         
-        print(f"✅ Saved {len(messages)} messages to {filepath}")
-        return filepath
+        message_count = 0
+        last_message_id = None
+        attachments_downloaded = 0
+        attachments_failed = 0
+        # Records waiting on attachment downloads, kept in channel order
+        pending = collections.deque()
+        # Download futures already counted: the downloader hands out one per attachment id,
+        # and a forward resolved from this archive reuses its original's
+        counted_attachments = set()
+        
+        async def write_ready(max_pending):
+            """Write finished records in order, blocking on the oldest while too many are pending"""
+            nonlocal last_message_id, attachments_downloaded, attachments_failed
+            ready = []
+            while pending:
+                record, attachment_futures = pending[0]
+                if len(pending) <= max_pending and not all(f.done() for f in attachment_futures):
+                    break
+                pending.popleft()
+                record["attachments"] = list(await asyncio.gather(*attachment_futures))
+                for future, attachment in zip(attachment_futures, record["attachments"]):
+                    if future in counted_attachments:
+                        continue
+                    counted_attachments.add(future)
+                    if attachment.get("downloaded"):
+                        attachments_downloaded += 1
+                    else:
+                        attachments_failed += 1
+                ready.append(record)
+            if not ready:
+                return
+            
+            # Encode and write the whole batch off the event loop
+            count_before = writer.message_count
+            await run_io(writer.write_many, ready)
+            ARCHIVE_MESSAGES.inc(len(ready))
+            last_message_id = ready[-1]["id"]
+            
+            # Only checkpoint what has actually been flushed to disk
+            if STREAM_FULL_ARCHIVES and writer.message_count // ARCHIVE_CHECKPOINT_EVERY > count_before // ARCHIVE_CHECKPOINT_EVERY:
+                await run_io(writer.flush)
+                await run_io(save_archive_checkpoint, channel.id, last_message_id, filename)
         
-    except Exception as e:
-        print(f"Error saving messages to JSON: {e}")
-        return None
+        resolver = MessageReferenceResolver()
         
-        # Extract data from each pin and download attachments
-        async with aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=30, connect=10)  # 30s total, 10s connect timeout
-        ) as session:
-            for pin in reversed(pins):  # Reverse to keep chronological order
-                try:
-                    # Debug: Print pin information
-                    print(f"Processing pin {pin.id}")
-                    print(f"  Content: '{pin.content}' (length: {len(pin.content)})")
-                    print(f"  Author: {pin.author.display_name}")
-                    print(f"  Attachments: {len(pin.attachments)}")
-                    print(f"  Embeds: {len(pin.embeds)}")
-                    
-                    # Download attachments with robust error handling
-                    attachment_data = []
-                    if pin.attachments:
-                        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                        for att in pin.attachments:
-                            print(f"  Downloading attachment: {att.filename}")
-                            try:
-                                # Download with individual timeout per attachment
-                                attachment_info = await asyncio.wait_for(
-                                    download_attachment(session, att, timestamp, guild.id),
-                                    timeout=20.0  # 20 second timeout per attachment
-                                )
-                                attachment_data.append(attachment_info)
-                                print(f"  ✓ Downloaded: {att.filename}")
-                            except asyncio.TimeoutError:
-                                print(f"  ⚠ Timeout downloading {att.filename}, continuing...")
-                                attachment_data.append({
-                                    "filename": att.filename,
-                                    "url": att.url,
-                                    "original_url": att.url,
-                                    "size": att.size,
-                                    "content_type": att.content_type,
-                                    "downloaded": False,
-                                    "error": "Download timeout"
-                                })
-                            except Exception as e:
-                                print(f"  ✗ Error downloading {att.filename}: {e}")
-                                attachment_data.append({
-                                    "filename": att.filename,
-                                    "url": att.url,
-                                    "original_url": att.url,
-                                    "size": att.size,
-                                    "content_type": att.content_type,
-                                    "downloaded": False,
-                                    "error": str(e)
-                                })
+        try:
+            async with AttachmentDownloader(guild.id) as downloader:
+                async for message in channel.history(limit=limit, oldest_first=True, after=after):
+                    message_count += 1
+                    if message_count % 100 == 0:
+                        print(f"  Processed {message_count} messages...")
                     
-                    pin_data = {
-                        "id": pin.id,
-                        "author": {
-                            "name": pin.author.display_name,
-                            "username": str(pin.author),
-                            "id": pin.author.id,
-                            "avatar_url": str(pin.author.display_avatar.url) if pin.author.display_avatar else None
-                        },
-                        "content": pin.content,
-                        "created_at": pin.created_at.isoformat(),
-                        "jump_url": pin.jump_url,
-                        "attachments": attachment_data,
-                        "embeds": [embed.to_dict() for embed in pin.embeds] if pin.embeds else [],
-                        "reactions": [
-                            {
-                                "emoji": str(reaction.emoji),
-                                "count": reaction.count
-                            }
-                            for reaction in pin.reactions                        ] if pin.reactions else [],
-                        "message_reference": {
-                            "message_id": pin.reference.message_id,
-                            "channel_id": pin.reference.channel_id,
-                            "guild_id": pin.reference.guild_id
-                        } if pin.reference else None,
-                        "type": str(pin.type) if hasattr(pin, 'type') else None
-                    }
-                    pins_data["pins"].append(pin_data)
-                except Exception as e:
-                    print(f"Error processing pin {pin.id}: {e}")
-        
-        # Save to file with timestamp in filename
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{channel_name}_{timestamp}.json"
-        filepath = os.path.join(PINS_DATA_DIR, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(pins_data, f, indent=2, ensure_ascii=False)
+                    try:
+                        pending.append(await build_message_record(message, downloader, resolver))
+                    except Exception as e:
+                        print(f"Error processing message {message.id}: {e}")
+                    await write_ready(ARCHIVE_MAX_PENDING_RECORDS)
+                
+                await write_ready(0)
+        except BaseException:
+            # Keep everything written so far, marked incomplete (NDJSON: no manifest,
+            # and the checkpoint lets the next run resume). Off the event loop: a
+            # JSON archive writes its whole document here
+            await run_io(writer.abort)
+            raise
+        
+        if checkpoint and writer.message_count == 0 and writer.was_complete:
+            # Nothing new: leave the archive (and its catalog entry) untouched
+            await run_io(writer.discard)
+            print(f"✅ No new messages in #{channel.name} since the last archive ({filename})")
+            return ArchiveResult(
+                filepath=filepath,
+                message_count=0,
+                bytes_written=0,
+                attachments_downloaded=attachments_downloaded,
+                attachments_failed=attachments_failed,
+                elapsed_seconds=time.monotonic() - started
+            )
         
-        print(f"Saved {len(pins)} pins to {filepath}")
-        return filepath
+        await run_io(writer.close)
+        if STREAM_FULL_ARCHIVES and compression_suffix() and append_to is None:
+            filename = f"{filename}{compression_suffix()}"
+            await run_io(compress_file, filepath, os.path.join(PINS_DATA_DIR, filename))
+            filepath = os.path.join(PINS_DATA_DIR, filename)
+        
+        # Also re-saved without new messages, since compression may have renamed the file
+        last_archived_id = last_message_id if last_message_id is not None else (after.id if after else None)
+        if STREAM_FULL_ARCHIVES and last_archived_id is not None:
+            await run_io(save_archive_checkpoint, channel.id, last_archived_id, filename)
+        
+        result = ArchiveResult(
+            filepath=filepath,
+            message_count=writer.message_count,
+            bytes_written=os.path.getsize(filepath) - size_before,
+            attachments_downloaded=attachments_downloaded,
+            attachments_failed=attachments_failed,
+            elapsed_seconds=time.monotonic() - started
+        )
+        ARCHIVE_BYTES.inc(max(0, result.bytes_written))
+        ARCHIVE_DURATION.observe(result.elapsed_seconds)
+        ARCHIVE_RATE.set(result.messages_per_second)
+        print(f"✅ Saved {result.message_count} messages to {filepath} "
+              f"({result.bytes_written} bytes, {result.attachments_downloaded} attachments, "
+              f"{result.attachments_failed} failed) in {result.elapsed_seconds:.1f}s "
+              f"({result.messages_per_second:.1f} msg/s)")
+        print(f"  References: {resolver.archive_hits} resolved from this archive, "
+              f"{resolver.cache_hits} from cache, {resolver.fetches} fetched")
+        await run_io(update_archive_index, filepath)
+        return result
         
     except Exception as e:
-        print(f"Error saving pins to JSON: {e}")
+        print(f"Error saving messages to JSON: {e}")
         return None
 
 @bot.event
@@ -518,56 +1112,214 @@ async def on_ready():
     
     reset_scheduler.start()
 
-@tasks.loop(minutes=1)
-async def reset_scheduler():
-    """Check all scheduled resets and execute them if it's time"""
-    tz = pytz.timezone(TIMEZONE)
-    now = datetime.datetime.now(tz)
-    current_date = now.strftime('%Y-%m-%d')
-    
-    # Log current time every 10 minutes for debugging
-    if now.minute % 10 == 0:
-        server_local = datetime.datetime.now()
-        print(f"[SCHEDULER] Bot time ({TIMEZONE}): {now.strftime('%Y-%m-%d %H:%M:%S %Z')} | VPS local: {server_local.strftime('%H:%M:%S')} | Checking {len(scheduled_resets)} channel schedules")
-    
-    # Check if we have any schedules at all
-    if not scheduled_resets:
-        if now.minute == 0:  # Log once per hour
-            print(f"[SCHEDULER] No schedules configured. Use /schedule_reset to add some!")
-        return
-    
-    # Check all guilds the bot is in
-    for guild in bot.guilds:
-        # Check each scheduled reset
+def schedule_occurrence(schedule, day, tz):
+    """Localized datetime of a daily schedule on a given calendar day"""
+    naive = datetime.datetime.combine(day, datetime.time(schedule['hour'], schedule['minute']))
+    return tz.normalize(tz.localize(naive))
+
+def schedule_key_for(occurrence, schedule):
+    """The last_reset key recorded for one occurrence of a schedule"""
+    return f"{occurrence.strftime('%Y-%m-%d')}-{schedule['hour']:02d}:{schedule['minute']:02d}"
+
+class ResetScheduler:
+    """Event-driven scheduler for daily channel resets.
+
+    Upcoming resets live in a min-heap keyed by their due time and the
+    scheduler sleeps until the earliest one, so an idle bot does O(1) work
+    instead of scanning every guild and schedule each minute. Adding or
+    removing schedules wakes it up to rebuild the heap. When the scheduler
+    first starts, resets that were missed while the bot was down are
+    handled per MISSED_RESET_POLICY.
+
+    Heap entries are (due, sequence, channel_name, schedule, catch_up);
+    catch-up entries are one-off and do not queue a follow-up run.
+
+    Due resets run as background tasks: different guilds reset in parallel
+    (up to MAX_CONCURRENT_RESETS at once) while resets within one guild are
+    serialized. Each run's start/finish delay relative to its scheduled time
+    is appended to reset_timings.
+    """
+
+    # Sleep in bounded steps so wall-clock jumps and DST changes are noticed
+    MAX_SLEEP_SECONDS = 3600
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()  # Tie-breaker so the heap never compares dicts
+        self._wakeup = None
+        self._task = None
+        self._running = set()  # In-flight reset tasks (kept referenced until done)
+        self._guild_locks = {}  # Serializes resets within a guild (shared Discord rate-limit buckets)
+        self._started = {}  # (guild id, schedule id) -> schedule key of the latest run started there
+        self._reset_slots = None  # Global cap on concurrent resets
+
+    def start(self):
+        """Start the scheduler task, or rebuild its queue if it is already running"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._reset_slots = asyncio.Semaphore(MAX_CONCURRENT_RESETS)
+            self._task = asyncio.create_task(self._run())
+        else:
+            self.reschedule()
+
+    def reschedule(self):
+        """Rebuild the queue after scheduled_resets changed"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def guild_lock(self, guild_id):
+        """Lock held while a channel of this guild is being reset (scheduled or manual)"""
+        return self._guild_locks.setdefault(guild_id, asyncio.Lock())
+
+    def _push(self, due, channel_name, schedule, catch_up=False):
+        heapq.heappush(self._heap, (due, next(self._sequence), channel_name, schedule, catch_up))
+
+    def _rebuild(self, now, catch_up):
+        """Compute the next due time of every schedule"""
+        tz = pytz.timezone(TIMEZONE)
+        grace = datetime.timedelta(hours=MISSED_RESET_GRACE_HOURS)
+        
+        # Resets that are already due but not yet run stay queued
+        overdue = [entry for entry in self._heap if entry[0] <= now]
+        self._heap = []
+        for entry in overdue:
+            self._push(entry[0], entry[2], entry[3], catch_up=True)
+        
+        # Forget runs of schedules that no longer exist
+        schedule_ids = {schedule['id'] for schedules in scheduled_resets.values() for schedule in schedules}
+        self._started = {key: run for key, run in self._started.items() if key[1] in schedule_ids}
+        
         for channel_name, schedules in scheduled_resets.items():
-            for schedule_index, schedule in enumerate(schedules):
-                # Check if it's time to reset and we haven't reset at this specific time today
-                schedule_key = f"{current_date}-{schedule['hour']:02d}:{schedule['minute']:02d}"
+            for schedule in schedules:
+                today = schedule_occurrence(schedule, now.date(), tz)
+                previous = today if today <= now else schedule_occurrence(schedule, now.date() - datetime.timedelta(days=1), tz)
+                upcoming = today if today > now else schedule_occurrence(schedule, now.date() + datetime.timedelta(days=1), tz)
                 
-                # Debug: Log when we're close to a scheduled time
-                time_until = (schedule['hour'] * 60 + schedule['minute']) - (now.hour * 60 + now.minute)
-                if time_until <= 2 and time_until >= 0:  # Within 2 minutes
-                    print(f"[SCHEDULER] Approaching reset time for {channel_name} in {time_until} minutes")
+                if catch_up and MISSED_RESET_POLICY == 'latest' and now - previous <= grace:
+                    # A manual reset later that day also covers the missed run
+                    done_keys = {schedule_key_for(previous, schedule), f"{previous.strftime('%Y-%m-%d')}-MANUAL"}
+                    if schedule.get('last_reset') not in done_keys:
+                        print(f"[SCHEDULER] Catching up missed reset for {channel_name} due {previous.strftime('%Y-%m-%d %H:%M %Z')}")
+                        self._push(previous, channel_name, schedule, catch_up=True)
                 
-                if (now.hour == schedule['hour'] and 
-                    now.minute == schedule['minute'] and 
-                    schedule.get('last_reset') != schedule_key):
-                    
-                    print(f"[SCHEDULER] ⏰ TRIGGERING scheduled reset for {channel_name} (schedule {schedule_index+1}) in {guild.name} at {now.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-                    
+                self._push(upcoming, channel_name, schedule)
+
+    async def _run(self):
+        tz = pytz.timezone(TIMEZONE)
+        rebuild = True
+        first_build = True  # Only the first build after startup looks for missed resets
+        while True:
+            try:
+                if rebuild or self._wakeup.is_set():
+                    self._wakeup.clear()
+                    self._rebuild(datetime.datetime.now(tz), first_build)
+                    rebuild = first_build = False
+                    if self._heap:
+                        due, _, channel_name, _, _ = self._heap[0]
+                        print(f"[SCHEDULER] Next reset: {channel_name} at {due.strftime('%Y-%m-%d %H:%M %Z')} ({len(self._heap)} queued)")
+                    else:
+                        print(f"[SCHEDULER] No schedules configured. Use /schedule_reset to add some!")
+                
+                if not self._heap:
+                    # Nothing scheduled; sleep until a schedule is added
+                    await self._wakeup.wait()
+                    continue
+                
+                due = self._heap[0][0]
+                delay = (due - datetime.datetime.now(tz)).total_seconds()
+                if delay > 0:
                     try:
-                        await reset_channel_by_name(guild, channel_name, schedule)
-                        
-                        # Update last reset date with specific time
-                        schedule['last_reset'] = schedule_key
-                        save_schedules()
-                        
-                        print(f"[SCHEDULER] ✅ Reset completed for {channel_name} in {guild.name}")
-                        
-                    except Exception as e:
-                        print(f"[SCHEDULER] ❌ Error during scheduled reset of {channel_name} in {guild.name}: {e}")
-                        import traceback
-                        traceback.print_exc()
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, self.MAX_SLEEP_SECONDS))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                due, _, channel_name, schedule, is_catch_up = heapq.heappop(self._heap)
+                if not is_catch_up:
+                    # Queue tomorrow's run before doing today's
+                    self._push(schedule_occurrence(schedule, due.date() + datetime.timedelta(days=1), tz), channel_name, schedule)
+                
+                # Run in the background so resets due at the same time start together
+                task = asyncio.create_task(self._fire(due, channel_name, schedule))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[SCHEDULER] ❌ Scheduler error: {e}")
+                import traceback
+                traceback.print_exc()
+                rebuild = True
+                await asyncio.sleep(5)
+
+    async def _fire(self, due, channel_name, schedule):
+        """Run one due reset in every guild concurrently"""
+        # The schedule may have been removed (or reloaded) while we were sleeping
+        schedule = next((s for s in scheduled_resets.get(channel_name, []) if s['id'] == schedule['id']), None)
+        if schedule is None:
+            return
+        
+        schedule_key = schedule_key_for(due, schedule)
+        if schedule.get('last_reset') == schedule_key:
+            return
+        
+        schedule_index = scheduled_resets[channel_name].index(schedule)
+        await asyncio.gather(*(
+            self._reset_guild(guild, due, channel_name, schedule_index, schedule, schedule_key)
+            for guild in bot.guilds
+        ))
+
+    async def _reset_guild(self, guild, due, channel_name, schedule_index, schedule, schedule_key):
+        """Reset one channel in one guild, one reset per guild at a time"""
+        async with self.guild_lock(guild.id), self._reset_slots:
+            # The same run can be fired twice (e.g. a catch-up entry and a rebuilt one)
+            # while the first is still waiting here; last_reset is shared by all guilds,
+            # so track the latest run started per guild (one entry per guild and schedule)
+            if self._started.get((guild.id, schedule['id'])) == schedule_key:
+                print(f"[SCHEDULER] Skipping duplicate reset of {channel_name} in {guild.name} ({schedule_key})")
+                return
+            self._started[(guild.id, schedule['id'])] = schedule_key
+            
+            started = datetime.datetime.now(due.tzinfo)
+            print(f"[SCHEDULER] ⏰ TRIGGERING scheduled reset for {channel_name} (schedule {schedule_index+1}) in {guild.name} at {started.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            
+            RESET_START_DELAY.observe(max(0.0, (started - due).total_seconds()))
+            
+            ok = False
+            phase_times = {}
+            try:
+                await reset_channel_by_name(guild, channel_name, schedule, phase_times)
+                ok = True
+                
+                # Update last reset date with specific time
+                schedule['last_reset'] = schedule_key
+                await run_io(update_last_reset, [schedule['id']], schedule_key)
+                
+            except Exception as e:
+                print(f"[SCHEDULER] ❌ Error during scheduled reset of {channel_name} in {guild.name}: {e}")
+                import traceback
+                traceback.print_exc()
+            
+            finished = datetime.datetime.now(due.tzinfo)
+            timing = {
+                "channel_name": channel_name,
+                "guild_id": guild.id,
+                "guild_name": guild.name,
+                "scheduled_for": due.isoformat(),
+                "start_delay_seconds": (started - due).total_seconds(),
+                "finish_delay_seconds": (finished - due).total_seconds(),
+                "phases": {phase: round(seconds, 3) for phase, seconds in phase_times.items()},
+                "succeeded": ok
+            }
+            reset_timings.append(timing)
+            RESET_FINISH_DELAY.observe(max(0.0, timing["finish_delay_seconds"]))
+            RESETS.inc(outcome="succeeded" if ok else "failed")
+            if ok:
+                phases = "".join(f", {phase} {seconds:.1f}s" for phase, seconds in phase_times.items())
+                print(f"[SCHEDULER] ✅ Reset completed for {channel_name} in {guild.name} "
+                      f"(started +{timing['start_delay_seconds']:.1f}s, finished +{timing['finish_delay_seconds']:.1f}s after scheduled time{phases})")
+
+reset_scheduler = ResetScheduler()
 
 async def _delete_message_after_delay(message, delay_seconds):
     """Helper function to delete a message after a delay"""
@@ -587,8 +1339,8 @@ async def _delete_interaction_after_delay(interaction, delay_seconds):
         # Message already deleted or no permission
         pass
 
-async def reset_channel_by_name(guild, channel_name, schedule):
-    """Reset a specific channel based on its schedule configuration"""
+async def reset_channel_by_name(guild, channel_name, schedule, phase_times=None):
+    """Reset a specific channel based on its schedule configuration (phase durations go into phase_times)"""
     channel_type = schedule['type']
     category_name = schedule.get('category')
     
@@ -602,7 +1354,7 @@ async def reset_channel_by_name(guild, channel_name, schedule):
     # Find the existing channel
     channel = discord.utils.get(guild.channels, name=channel_name)
     if channel:
-        await reset_channel_with_preservation(channel, category, channel_type)
+        await reset_channel_with_preservation(channel, category, channel_type, phase_times)
         print(f"Reset {channel_type} channel: {channel_name}")
     else:
         # Create new channel if it doesn't exist
@@ -614,8 +1366,83 @@ async def reset_channel_by_name(guild, channel_name, schedule):
             raise ValueError(f"Invalid channel type: {channel_type}")
         print(f"Created {channel_type} channel: {channel_name}")
 
-async def reset_channel_with_preservation(channel, category=None, channel_type='text'):
-    """Reset a channel while preserving pinned messages"""
+async def _delete_single_messages(messages):
+    """Delete messages one REST call at a time (for messages too old to bulk delete)"""
+    deleted = 0
+    for message in messages:
+        try:
+            await message.delete()
+            deleted += 1
+            
+            # Add small delay to avoid rate limits
+            if deleted % 10 == 0:
+                await asyncio.sleep(0.1)
+                
+        except discord.NotFound:
+            # Message already deleted, continue
+            pass
+        except discord.Forbidden:
+            print(f"No permission to delete message {message.id}")
+        except Exception as e:
+            print(f"Error deleting message {message.id}: {e}")
+    return deleted
+
+async def _bulk_delete_messages(channel, messages):
+    """Delete up to 100 recent messages with a single bulk-delete call"""
+    if len(messages) == 1:
+        return await _delete_single_messages(messages)
+    try:
+        await channel.delete_messages(messages)
+        return len(messages)
+    except discord.HTTPException as e:
+        # E.g. a message crossed the 14-day line or was already deleted
+        print(f"Bulk delete of {len(messages)} messages failed ({e}), deleting individually")
+        return await _delete_single_messages(messages)
+
+async def delete_unpinned_messages(channel, pinned_messages, progress=None):
+    """Delete every message in a channel whose id is not in pinned_messages.
+
+    Messages younger than 14 days are removed in bulk-delete batches of up
+    to 100; Discord only allows single deletes for anything older. The
+    history is walked once; ``progress`` (an async callable) is awaited
+    with the running (deleted, preserved) counts every CLEAR_PROGRESS_EVERY
+    messages. Returns the final (deleted, preserved) counts.
+    """
+    # Stay clear of the 14-day limit so messages don't age out mid-batch
+    bulk_cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE + datetime.timedelta(minutes=5)
+    deleted_count = 0
+    preserved_count = 0
+    seen = 0
+    batch = []
+    
+    async for message in channel.history(limit=None, oldest_first=False):
+        seen += 1
+        if message.id in pinned_messages:
+            preserved_count += 1
+        elif USE_BULK_DELETE and message.created_at > bulk_cutoff:
+            batch.append(message)
+            if len(batch) == BULK_DELETE_BATCH_SIZE:
+                deleted_count += await _bulk_delete_messages(channel, batch)
+                batch = []
+        else:
+            if batch:
+                deleted_count += await _bulk_delete_messages(channel, batch)
+                batch = []
+            deleted_count += await _delete_single_messages([message])
+        
+        if progress and seen % CLEAR_PROGRESS_EVERY == 0:
+            await progress(deleted_count, preserved_count)
+    
+    if batch:
+        deleted_count += await _bulk_delete_messages(channel, batch)
+    return deleted_count, preserved_count
+
+async def reset_channel_with_preservation(channel, category=None, channel_type='text', phase_times=None):
+    """Reset a channel while preserving pinned messages.
+
+    Each phase (pin fetch, JSON save, forward, delete/recreate, ...) is timed
+    into RESET_PHASE_SECONDS and, if given, the phase_times dict.
+    """
     
     # FOR FAST RESETS: Use archive method (move pins to separate channel, then recreate)
     # Set to False to use slow method (delete messages one by one)
@@ -629,14 +1456,15 @@ async def reset_channel_with_preservation(channel, category=None, channel_type='
         channel_position = channel.position
         overwrites = channel.overwrites
         
-        await channel.delete()
-        
-        new_channel = await channel.guild.create_voice_channel(
-            name=channel_name,
-            category=channel_category,
-            position=channel_position,
-            overwrites=overwrites
-        )
+        with reset_phase("delete_recreate", phase_times):
+            await channel.delete()
+            
+            new_channel = await channel.guild.create_voice_channel(
+                name=channel_name,
+                category=channel_category,
+                position=channel_position,
+                overwrites=overwrites
+            )
         return new_channel
     
     # For text channels, choose fast or slow method
@@ -649,8 +1477,9 @@ async def reset_channel_with_preservation(channel, category=None, channel_type='
         try:
             # Get pinned messages and extract ALL content BEFORE deleting channel
             pins = []
-            async for pin in channel.pins():
-                pins.append(pin)
+            with reset_phase("pin_fetch", phase_times):
+                async for pin in channel.pins():
+                    pins.append(pin)
             pinned_count = len(pins)
             archived_count = 0
             
@@ -659,41 +1488,43 @@ async def reset_channel_with_preservation(channel, category=None, channel_type='
                 json_file = None
                 if not PINS_ENABLED_SERVER_IDS or guild.id in PINS_ENABLED_SERVER_IDS:
                     try:
-                        json_file = await save_pins_to_json(channel_name, pins, guild)
+                        with reset_phase("json_save", phase_times):
+                            json_file = await save_pins_to_json(channel_name, pins, guild)
                         print(f"✅ Pins saved to web interface for server: {guild.name} (ID: {guild.id})")
                     except Exception as e:
                         print(f"Error saving pins to JSON: {e}")
                 else:
                     print(f"📝 Pin saving disabled for server: {guild.name} (ID: {guild.id})")
                 
-                # Find or create archive channel BEFORE deleting the main channel
-                archive_channel = discord.utils.get(guild.text_channels, name=archive_name)
-                if not archive_channel:
-                    archive_channel = await guild.create_text_channel(
-                        archive_name, 
-                        category=category or channel.category,
-                        topic=f"📌 Archived pins from #{channel_name}"
+                with reset_phase("forward", phase_times):
+                    # Find or create archive channel BEFORE deleting the main channel
+                    archive_channel = discord.utils.get(guild.text_channels, name=archive_name)
+                    if not archive_channel:
+                        archive_channel = await guild.create_text_channel(
+                            archive_name, 
+                            category=category or channel.category,
+                            topic=f"📌 Archived pins from #{channel_name}"
+                        )
+                        print(f"Created archive channel: {archive_name}")
+                    
+                    # Add separator
+                    separator_embed = discord.Embed(
+                        title=f"📌 Pins from #{channel_name}",
+                        description=f"Reset: <t:{int(datetime.datetime.now().timestamp())}:F>",
+                        color=0x99ccff
                     )
-                    print(f"Created archive channel: {archive_name}")
-                
-                # Add separator
-                separator_embed = discord.Embed(
-                    title=f"📌 Pins from #{channel_name}",
-                    description=f"Reset: <t:{int(datetime.datetime.now().timestamp())}:F>",
-                    color=0x99ccff
-                )
-                await archive_channel.send(embed=separator_embed)
-                
-                # Forward all pinned messages to archive channel (preserves everything!)
-                for pin in reversed(pins):  # Reverse to keep chronological order
-                    try:
-                        # Forward the message - this preserves all content, embeds, attachments
-                        await pin.forward(archive_channel)
-                        archived_count += 1
-                        print(f"Forwarded pin {pin.id} to archive")
-                    except Exception as e:
-                        print(f"Error forwarding pin {pin.id}: {e}")
-                
+                    await archive_channel.send(embed=separator_embed)
+                    
+                    # Forward all pinned messages to archive channel (preserves everything!)
+                    for pin in reversed(pins):  # Reverse to keep chronological order
+                        try:
+                            # Forward the message - this preserves all content, embeds, attachments
+                            await pin.forward(archive_channel)
+                            archived_count += 1
+                            print(f"Forwarded pin {pin.id} to archive")
+                        except Exception as e:
+                            print(f"Error forwarding pin {pin.id}: {e}")
+                    
                 print(f"Forwarded {archived_count}/{pinned_count} pins to archive")
                 if json_file:
                     print(f"Also saved pins to JSON: {json_file}")
@@ -706,15 +1537,16 @@ async def reset_channel_with_preservation(channel, category=None, channel_type='
             overwrites = channel.overwrites
             
             # Delete and recreate channel (FAST!)
-            await channel.delete()
-            new_channel = await guild.create_text_channel(
-                name=channel_name,
-                category=channel_category,
-                position=channel_position,
-                topic=channel_topic,
-                slowmode_delay=channel_slowmode,
-                overwrites=overwrites
-            )
+            with reset_phase("delete_recreate", phase_times):
+                await channel.delete()
+                new_channel = await guild.create_text_channel(
+                    name=channel_name,
+                    category=channel_category,
+                    position=channel_position,
+                    topic=channel_topic,
+                    slowmode_delay=channel_slowmode,
+                    overwrites=overwrites
+                )
             
             # Success message
             embed = discord.Embed(
@@ -741,29 +1573,15 @@ async def reset_channel_with_preservation(channel, category=None, channel_type='
     try:
         # Get all pinned messages first
         pins = []
-        async for pin in channel.pins():
-            pins.append(pin)
+        with reset_phase("pin_fetch", phase_times):
+            async for pin in channel.pins():
+                pins.append(pin)
         pinned_messages = {pin.id for pin in pins}
         print(f"Found {len(pinned_messages)} pinned messages to preserve")
         
         # Delete messages in batches, skipping pinned ones
-        async for message in channel.history(limit=None, oldest_first=False):
-            if message.id not in pinned_messages:
-                try:
-                    await message.delete()
-                    deleted_count += 1
-                    
-                    # Add small delay to avoid rate limits
-                    if deleted_count % 10 == 0:
-                        await asyncio.sleep(0.1)
-                        
-                except discord.NotFound:
-                    # Message already deleted, continue
-                    pass
-                except discord.Forbidden:
-                    print(f"No permission to delete message {message.id}")
-                except Exception as e:
-                    print(f"Error deleting message {message.id}: {e}")
+        with reset_phase("delete_messages", phase_times):
+            deleted_count, _ = await delete_unpinned_messages(channel, pinned_messages)
         
         print(f"Deleted {deleted_count} messages, preserved {len(pinned_messages)} pinned messages")
         
@@ -782,7 +1600,8 @@ async def reset_channel_with_preservation(channel, category=None, channel_type='
     except Exception as e:
         print(f"Error during message deletion: {e}")
         # Fall back to recreating the channel if message deletion fails
-        return await reset_channel_by_recreation(channel, category, channel_type)
+        with reset_phase("delete_recreate", phase_times):
+            return await reset_channel_by_recreation(channel, category, channel_type)
     
     return channel
 
@@ -904,8 +1723,9 @@ async def schedule_reset_slash(interaction: discord.Interaction, channel_name: s
     if channel_name not in scheduled_resets:
         scheduled_resets[channel_name] = []
     
+    await run_io(add_schedule, channel_name, new_schedule)
     scheduled_resets[channel_name].append(new_schedule)
-    save_schedules()
+    reset_scheduler.reschedule()
     
     schedule_count = len(scheduled_resets[channel_name])
     category_text = f" in category '{category}'" if category else ""
@@ -971,8 +1791,9 @@ async def remove_schedule_slash(interaction: discord.Interaction, channel_name:
     
     if schedule_index is None:
         # Remove all schedules for this channel
+        await run_io(remove_schedules, [schedule['id'] for schedule in schedules])
         del scheduled_resets[channel_name]
-        save_schedules()
+        reset_scheduler.reschedule()
         await interaction.response.send_message(f"✅ Removed all {len(schedules)} scheduled reset(s) for **{channel_name}**")
         print(f"All schedules removed by {interaction.user}: {channel_name}")
     else:
@@ -981,12 +1802,13 @@ async def remove_schedule_slash(interaction: discord.Interaction, channel_name:
             await interaction.response.send_message(f"❌ Invalid schedule number. **{channel_name}** has {len(schedules)} schedule(s) (1-{len(schedules)})", ephemeral=True)
             return
         
+        await run_io(remove_schedules, [schedules[schedule_index - 1]['id']])
         removed_schedule = schedules.pop(schedule_index - 1)  # Convert to 0-based index
         
         if not schedules:  # If no schedules left, remove the channel entirely
             del scheduled_resets[channel_name]
         
-        save_schedules()
+        reset_scheduler.reschedule()
         
         time_str = f"{removed_schedule['hour']:02d}:{removed_schedule['minute']:02d}"
         remaining = len(schedules) if schedules else 0
@@ -1022,16 +1844,18 @@ async def reset_now_slash(interaction: discord.Interaction, channel_name: str):
         # Use the first schedule for channel properties (type, category)
         # All schedules for a channel should have the same type and category
         schedule = scheduled_resets[channel_name][0]
-        await reset_channel_by_name(guild, channel_name, schedule)
-        
-        # Update last reset date for all schedules of this channel
-        tz = pytz.timezone(TIMEZONE)
-        now = datetime.datetime.now(tz)
-        reset_key = f"{now.strftime('%Y-%m-%d')}-MANUAL"
-        
-        for schedule in scheduled_resets[channel_name]:
-            schedule['last_reset'] = reset_key
-        save_schedules()
+        # Wait for any scheduled reset running in this guild, and keep new ones out until done
+        async with reset_scheduler.guild_lock(guild.id):
+            await reset_channel_by_name(guild, channel_name, schedule)
+            
+            # Update last reset date for all schedules of this channel
+            tz = pytz.timezone(TIMEZONE)
+            now = datetime.datetime.now(tz)
+            reset_key = f"{now.strftime('%Y-%m-%d')}-MANUAL"
+            
+            for schedule in scheduled_resets[channel_name]:
+                schedule['last_reset'] = reset_key
+            await run_io(update_last_reset, [schedule['id'] for schedule in scheduled_resets[channel_name]], reset_key)
         
         schedule_count = len(scheduled_resets[channel_name])
         await interaction.edit_original_response(content=f"✅ **{channel_name}** has been reset successfully! ({schedule_count} schedule(s) updated)")
@@ -1156,42 +1980,37 @@ async def clear_channel_slash(interaction: discord.Interaction, confirm: str):
     try:
         channel = interaction.channel
         
-        # Count total messages first
-        total_count = 0
-        pinned_count = 0
-        async for message in channel.history(limit=None):
-            total_count += 1
-        
-        # Count pinned messages
-        pins = []
+        # Pins are the only thing fetched up front; everything else is
+        # counted while it is being deleted, in a single pass over history
+        pinned_ids = set()
         async for pin in channel.pins():
-            pins.append(pin)
-        pinned_count = len(pins)
-        messages_to_delete = total_count - pinned_count
+            pinned_ids.add(pin.id)
         
-        if total_count == 0:
-            await interaction.edit_original_response(content="✅ Channel is already empty!")
-            asyncio.create_task(_delete_interaction_after_delay(interaction, 30))
-            return
-        
-        if messages_to_delete == 0:
-            await interaction.edit_original_response(content="✅ Channel only contains pinned messages!")
-            asyncio.create_task(_delete_interaction_after_delay(interaction, 30))
-            return
+        async def report_progress(deleted, preserved):
+            try:
+                await interaction.edit_original_response(
+                    content=f"🧹 Clearing... {deleted} messages deleted so far ({preserved} pinned preserved)"
+                )
+            except discord.HTTPException:
+                # Progress updates are best-effort
+                pass
         
-        # Confirm we're about to delete messages
-        progress_message = await interaction.edit_original_response(
-            content=f"🧹 Found {total_count} total messages ({pinned_count} pinned). "
-                   f"Deleting {messages_to_delete} messages while preserving pins..."
-        )
+        # Delete in place so the channel itself is kept
+        deleted_count, pinned_count = await delete_unpinned_messages(channel, pinned_ids, progress=report_progress)
         
-        # Use our new preservation function that keeps the channel
-        await reset_channel_with_preservation(channel)
+        if deleted_count == 0 and pinned_count == 0:
+            await interaction.edit_original_response(content="✅ Channel is already empty!")
+        elif deleted_count == 0:
+            await interaction.edit_original_response(content="✅ Channel only contains pinned messages!")
+        else:
+            await interaction.edit_original_response(
+                content=f"✅ Deleted {deleted_count} messages, preserved {pinned_count} pinned messages."
+            )
         
         # Delete the progress message after 30 seconds
         asyncio.create_task(_delete_interaction_after_delay(interaction, 30))
         
-        print(f"Channel cleared by {interaction.user}: #{channel.name} ({messages_to_delete} messages deleted, {pinned_count} pins preserved)")
+        print(f"Channel cleared by {interaction.user}: #{channel.name} ({deleted_count} messages deleted, {pinned_count} pins preserved)")
         
     except discord.Forbidden:
         await interaction.edit_original_response(content="❌ I don't have permission to delete/create channels in this server.")
@@ -1204,9 +2023,10 @@ async def clear_channel_slash(interaction: discord.Interaction, confirm: str):
 @bot.tree.command(name="archive_messages", description="Save all messages from current channel to web interface")
 @app_commands.describe(
     limit="Maximum number of messages to archive (default: all messages)",
-    confirm="Type 'yes' to confirm archiving all messages"
+    confirm="Type 'yes' to confirm archiving all messages",
+    resume="Continue this channel's previous archive with only newer messages (default: yes)"
 )
-async def archive_messages_slash(interaction: discord.Interaction, confirm: str, limit: int = None):
+async def archive_messages_slash(interaction: discord.Interaction, confirm: str, limit: int = None, resume: bool = True):
     """Archive all messages from the current channel to the web interface"""
     
     # Safety check - require explicit confirmation
@@ -1242,23 +2062,22 @@ async def archive_messages_slash(interaction: discord.Interaction, confirm: str,
     
     try:
         # Start the archiving process
-        archive_file = await save_all_messages_to_json(channel, guild, limit)
+        result = await save_all_messages_to_json(channel, guild, limit, resume=resume)
         
-        if archive_file:
+        if result:
             # Success message
-            message_count = 0
-            try:
-                # Count messages for display
-                async for _ in channel.history(limit=limit):
-                    message_count += 1
-            except:
-                message_count = "unknown"
+            archive_file = result.filepath
+            attachment_line = f"- Attachments saved: {result.attachments_downloaded}"
+            if result.attachments_failed:
+                attachment_line += f" ({result.attachments_failed} failed)"
             
             embed = discord.Embed(
                 title="✅ Channel Archive Complete",
                 description=f"**#{channel.name}** has been archived to your web interface!\n\n"
                            f"📊 **Stats:**\n"
-                           f"- Messages archived: {message_count}\n"
+                           f"- Messages archived: {result.message_count}\n"
+                           f"{attachment_line}\n"
+                           f"- Time taken: {result.elapsed_seconds:.1f}s ({result.messages_per_second:.1f} messages/s)\n"
                            f"- Archive file: `{os.path.basename(archive_file)}`\n"
                            f"- Available at: Your pins web interface",
                 color=0x00ff00
@@ -1299,7 +2118,7 @@ async def help_slash(interaction: discord.Interaction):
         name="Other Commands",
         value="`/reset_now channel_name` - Manual reset\n"
               "`/resploot-clear confirm:yes` - Clear ALL messages (preserves pinned)\n"
-              "`/archive_messages confirm:yes` - Save ALL messages to web interface\n"
+              "`/archive_messages confirm:yes` - Save ALL messages to web interface (repeat runs only add new messages; `resume:False` starts over)\n"
               "`/ping` - Test if bot is online",
         inline=False
     )
@@ -1322,5 +2141,6 @@ async def help_slash(interaction: discord.Interaction):
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-# Start the bot
-bot.run(TOKEN)
+# Start the bot (importing this module, e.g. from benchmarks/, does not)
+if __name__ == "__main__":
+    bot.run(TOKEN)
@@ -0,0 +1,262 @@
+"""
+In-process metrics for the Discord bot
+
+A small registry of counters, gauges and histograms, rendered in the
+Prometheus text format at /metrics and as JSON at /metrics.json by an
+aiohttp server inside the bot process (localhost only by default). Also
+home to two collectors that need no cooperation from the code they
+measure: an event-loop lag monitor, and a logging handler that counts the
+429 responses discord.py reports while it waits out rate limits.
+
+All updates happen on the event loop or under a lock, so metrics can be
+touched from anywhere in the bot.
+"""
+
+import re
+import json
+import asyncio
+import logging
+import threading
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{value.replace(chr(92), chr(92) * 2).replace(chr(10), "").replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+class Counter(_Metric):
+    """Monotonically increasing total"""
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def as_json(self):
+        with self._lock:
+            return [{"labels": dict(zip(self.labelnames, key)), "value": value} for key, value in sorted(self._values.items())]
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+    def as_json(self):
+        with self._lock:
+            samples = []
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                buckets = {}
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    buckets[_format_value(bound)] = cumulative
+                samples.append({
+                    "labels": dict(zip(self.labelnames, key)),
+                    "count": state["count"],
+                    "sum": state["sum"],
+                    "mean": state["sum"] / state["count"] if state["count"] else None,
+                    "buckets": buckets,
+                })
+            return samples
+
+class MetricsRegistry:
+    """Named collection of metrics with Prometheus text and JSON renderings"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def as_json(self):
+        return {
+            name: {"type": metric.type_name, "help": metric.documentation, "samples": metric.as_json()}
+            for name, metric in self._metrics.items()
+        }
+
+REGISTRY = MetricsRegistry()
+
+async def start_metrics_server(host, port, registry=REGISTRY, extra_json=None):
+    """Serve /metrics (Prometheus text) and /metrics.json; returns the AppRunner to clean up.
+
+    ``extra_json`` is an optional callable whose dict is merged into the
+    JSON output (e.g. recent reset details that don't fit a metric).
+    """
+    async def prometheus(request):
+        return web.Response(text=registry.render_prometheus(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def json_metrics(request):
+        data = {"metrics": registry.as_json()}
+        if extra_json:
+            data.update(extra_json())
+        return web.json_response(data, dumps=lambda obj: json.dumps(obj, default=str))
+
+    app = web.Application()
+    app.router.add_get('/metrics', prometheus)
+    app.router.add_get('/metrics.json', json_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop wakes a task that asked to sleep `interval` seconds.
+
+    Sustained lag means something is blocking the loop (and with it the
+    gateway heartbeat and every scheduled reset).
+    """
+
+    def __init__(self, histogram, gauge, interval=0.5):
+        self.histogram = histogram
+        self.gauge = gauge
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.histogram.observe(lag)
+            self.gauge.set(lag)
+
+class RateLimitLogHandler(logging.Handler):
+    """Counts the 429s discord.py logs on the discord.http logger.
+
+    discord.py handles rate limits itself (sleeping for retry_after and
+    retrying), so its log messages are the only place they are visible.
+    Every 429 gets one "We are being rate limited" line, which is what
+    ``counter`` counts; a global one is followed by a second line, counted
+    in ``global_counter`` only. ``wait_counter`` adds up retry_after for
+    the 429s discord.py actually sleeps on (not those it raises for).
+    """
+
+    _IDS = re.compile(r"/\d{15,}")
+
+    def __init__(self, counter, wait_counter, global_counter):
+        super().__init__(level=logging.WARNING)
+        self.counter = counter
+        self.wait_counter = wait_counter
+        self.global_counter = global_counter
+
+    def emit(self, record):
+        try:
+            message = str(record.msg)
+            if message.startswith('We are being rate limited.') and len(record.args or ()) >= 3:
+                method, url, retry_after = record.args[:3]
+                # Collapse ids so each route is one series
+                route = self._IDS.sub('/{id}', str(url).split('/api/v', 1)[-1].split('/', 1)[-1])
+                self.counter.inc(method=method, route=f"/{route}")
+                if 'Retrying in' in message:
+                    self.wait_counter.inc(float(retry_after))
+            elif message.startswith('Global rate limit has been hit.'):
+                self.global_counter.inc()
+        except Exception:
+            self.handleError(record)
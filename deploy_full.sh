@@ -70,6 +70,12 @@ server {
         proxy_set_header X-Content-Type-Options nosniff;
         proxy_set_header X-XSS-Protection "1; mode=block";
     }
+
+    # Attachment bytes handed off by the viewer when ATTACHMENT_OFFLOAD=x-accel
+    location /protected-attachments/ {
+        internal;
+        alias $DEPLOY_DIR/pins_data/attachments/;
+    }
 }
 EOF
 
@@ -101,7 +107,7 @@ echo "   - FLASK_SECRET_KEY=your_flask_secret_key"
 echo "3. Update the GUILD_ID in bot.py with your server ID if needed"
 echo "4. Test the services:"
 echo "   - Bot: source venv/bin/activate && python3 bot.py"
-echo "   - Viewer: source venv/bin/activate && python3 pins_viewer.py"
+echo "   - Viewer: source venv/bin/activate && gunicorn -c gunicorn.conf.py 'pins_viewer:create_app()'"
 echo ""
 echo "To start with PM2:"
 echo "5. pm2 start ecosystem.config.json"
@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for the pins viewer in production
+
+    gunicorn -c gunicorn.conf.py "pins_viewer:create_app()"
+
+Several worker processes, each with a pool of threads, so one slow archive
+render or a long attachment download does not hold up other users. The app
+is loaded (and the catalog refreshed) once in the master before forking.
+"""
+
+import os
+import multiprocessing
+
+bind = os.getenv("PINS_VIEWER_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("PINS_VIEWER_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = "gthread"
+threads = int(os.getenv("PINS_VIEWER_THREADS", "8"))  # Concurrent requests per worker
+preload_app = True
+
+timeout = 120  # Large archives and media transfers on slow links
+graceful_timeout = 30
+keepalive = 5
+max_requests = 1000  # Recycle workers now and then to cap memory growth
+max_requests_jitter = 100
+
+accesslog = "-"
+errorlog = "-"
+
+# Same optional certificate as the development server
+if os.path.exists('ssl_cert.pem') and os.path.exists('ssl_key.pem'):
+    certfile = 'ssl_cert.pem'
+    keyfile = 'ssl_key.pem'
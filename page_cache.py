@@ -0,0 +1,116 @@
+"""
+Rendered-page cache for the pins viewer
+
+Archive files do not change once the bot has written them, so a rendered
+page can be reused for as long as the files it was built from are unchanged.
+Callers put the file mtimes/sizes (and anything else the page depends on) in
+the key: a changed or new archive simply produces a new key, and the old
+entry ages out of the LRU. No explicit invalidation is needed.
+
+Pages are kept in memory, and optionally also on disk so they survive
+restarts and are shared between server worker processes.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+DISK_CACHE_MAX_FILES = 1000  # Oldest files are pruned beyond this many
+
+class PageCache:
+    """Thread-safe LRU of rendered HTML, with an optional on-disk second level"""
+
+    def __init__(self, max_entries=64, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def digest(key):
+        """Short stable hash of a cache key, also usable as an ETag"""
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{self.digest(key)}.html")
+
+    def _remember(self, key, html):
+        with self._lock:
+            self._pages[key] = html
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached page for key, or None"""
+        with self._lock:
+            html = self._pages.get(key)
+            if html is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return html
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), encoding='utf-8') as f:
+                    html = f.read()
+            except OSError:
+                html = None
+            if html is not None:
+                self._remember(key, html)
+                self.hits += 1
+                return html
+
+        self.misses += 1
+        return None
+
+    def put(self, key, html):
+        """Store a rendered page"""
+        self._remember(key, html)
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write page cache file {path}: {e}")
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Drop the least recently written files once the disk cache grows too large"""
+        try:
+            with os.scandir(self.disk_dir) as entries:
+                files = [(entry.stat().st_mtime_ns, entry.path) for entry in entries
+                         if entry.is_file() and entry.name.endswith('.html')]
+        except OSError:
+            return
+        files.sort()
+        for _, path in files[:max(0, len(files) - DISK_CACHE_MAX_FILES)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Forget every cached page, in memory and on disk"""
+        with self._lock:
+            self._pages.clear()
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.html'):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
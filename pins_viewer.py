@@ -4,19 +4,40 @@ Discord Pins Viewer - Password-protected web interface for viewing saved pins
 """
 
 import os
-import json
-import glob
+import mimetypes
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, abort, make_response
 from functools import wraps
+from urllib.parse import quote
+from werkzeug.security import safe_join
+
+import archive_catalog
+import thumbnails
+from page_cache import PageCache
+from archive_io import is_archive_filename, iso_to_ms
 
 # Configuration
 PINS_DATA_DIR = "pins_data"
 PASSWORD = os.getenv("PINS_VIEWER_PASSWORD", "your_secure_password_here")  # Change this!
 SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "change-this-secret-key-in-production")
+SEARCH_PAGE_SIZE = 50  # Default number of search results per page
+SEARCH_MAX_PAGE_SIZE = 200
+ARCHIVE_PAGE_SIZE = 50  # Messages rendered per page on the archive view
+ARCHIVE_MAX_PAGE_SIZE = 200
+ATTACHMENTS_DIR = os.path.join(PINS_DATA_DIR, "attachments")
+ATTACHMENT_CACHE_SECONDS = 365 * 24 * 3600  # Attachment files never change once written (blobs are named by content hash)
+# Let the front proxy send attachment bytes: "" (Flask sends them), "x-accel" (nginx) or "x-sendfile" (Apache/lighttpd)
+ATTACHMENT_OFFLOAD = os.getenv("ATTACHMENT_OFFLOAD", "").lower()
+ATTACHMENT_ACCEL_PREFIX = os.getenv("ATTACHMENT_ACCEL_PREFIX", "/protected-attachments")  # nginx internal location for x-accel
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "64"))  # Rendered index/archive pages kept in memory per process
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "")  # Also keep rendered pages in this directory ("" = memory only)
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+# send_file emits X-Sendfile instead of the body; the proxy must be set up to honour it
+app.config['USE_X_SENDFILE'] = ATTACHMENT_OFFLOAD == 'x-sendfile'
+
+page_cache = PageCache(PAGE_CACHE_SIZE, PAGE_CACHE_DIR or None)
 
 def login_required(f):
     """Decorator to require login for protected routes"""
@@ -27,45 +48,71 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def attachment_image_url(attachment, kind):
+    """URL of an image attachment's thumbnail or preview, falling back to the original.
+
+    Archives written before thumbnails existed have no *_filename fields;
+    derivatives made later by `python thumbnails.py` are still found on disk.
+    """
+    filename = attachment.get(f'{kind}_filename')
+    if not filename:
+        derived = thumbnails.derivative_filename(attachment['local_filename'], kind)
+        if os.path.isfile(os.path.join(ATTACHMENTS_DIR, derived)):
+            filename = derived
+    return url_for('serve_attachment', filename=filename or attachment['local_filename'])
+
+@app.context_processor
+def template_helpers():
+    return {'attachment_image_url': attachment_image_url}
+
+def templates_signature():
+    """Latest template modification time, so edited templates are not served from the cache"""
+    templates_dir = os.path.join(app.root_path, app.template_folder)
+    with os.scandir(templates_dir) as entries:
+        return max((entry.stat().st_mtime_ns for entry in entries if entry.is_file()), default=0)
+
+def cached_page(key_parts, render):
+    """Serve a rendered page from the page cache, calling render() to build it on a miss.
+
+    key_parts must identify everything the page is built from (e.g. archive
+    mtime/size). Pages with pending flash messages are neither cached nor
+    served from the cache, since the messages are part of the page.
+    """
+    if session.get('_flashes'):
+        return render()
+    
+    key = "|".join(str(part) for part in (*key_parts, templates_signature()))
+    html = page_cache.get(key)
+    status = 'hit'
+    if html is None:
+        html = render()
+        page_cache.put(key, html)
+        status = 'miss'
+    
+    response = make_response(html)
+    response.headers['X-Page-Cache'] = status
+    # Let the browser revalidate with If-None-Match instead of downloading the page again
+    response.set_etag(page_cache.digest(key))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 def load_all_archives():
-    """Load all archive files (pins and full messages) from the pins_data directory"""
-    archive_files = []
-    
-    if not os.path.exists(PINS_DATA_DIR):
-        return archive_files
-    
-    # Get all JSON files in the pins directory
-    json_files = glob.glob(os.path.join(PINS_DATA_DIR, "*.json"))
-    
-    for file_path in sorted(json_files, reverse=True):  # Most recent first
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                data['filename'] = os.path.basename(file_path)
-                data['file_path'] = file_path
-                
-                # Determine archive type
-                if 'archive_type' in data and data['archive_type'] == 'full_messages':
-                    data['display_type'] = 'Full Archive'
-                    data['item_count'] = data.get('message_count', 0)
-                    data['items'] = data.get('messages', [])
-                else:
-                    data['display_type'] = 'Pins Only'
-                    data['item_count'] = data.get('pin_count', 0)
-                    data['items'] = data.get('pins', [])
-                
-                archive_files.append(data)
-        except Exception as e:
-            print(f"Error loading {file_path}: {e}")
-    
-    return archive_files
+    """List all archive files (pins and full messages) from the catalog.
+
+    Only metadata is returned; archive bodies are not opened unless the
+    catalog needs to (re)index a new or modified file.
+    """
+    return archive_catalog.list_archives(PINS_DATA_DIR)
 
 @app.route('/')
 @login_required
 def index():
     """Main page showing all saved archives (pins and full messages)"""
-    archive_files = load_all_archives()
-    return render_template('index.html', archive_files=archive_files)
+    return cached_page(
+        ('index', archive_catalog.directory_signature(PINS_DATA_DIR)),
+        lambda: render_template('index.html', archive_files=load_all_archives())
+    )
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -89,64 +136,157 @@ def logout():
 @app.route('/view/<filename>')
 @login_required
 def view_pins(filename):
-    """View pins from a specific file"""
+    """View pins from a specific file.
+
+    Only the first page of items is rendered; the page fetches the rest from
+    /api/archive/<filename>/messages as the user scrolls.
+    """
     file_path = os.path.join(PINS_DATA_DIR, filename)
     
-    if not os.path.exists(file_path) or not filename.endswith('.json'):
+    if not os.path.exists(file_path) or not is_archive_filename(filename):
         flash('Pin file not found', 'error')
         return redirect(url_for('index'))
     
+    def render():
+        data = archive_catalog.ensure_indexed(PINS_DATA_DIR, filename)
+        items, next_cursor = archive_catalog.archive_page(PINS_DATA_DIR, filename, limit=ARCHIVE_PAGE_SIZE)
+        return render_template(
+            'view_pins.html', data=data, items=items, next_cursor=next_cursor,
+            filename=filename, page_size=ARCHIVE_PAGE_SIZE
+        )
+    
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return render_template('view_pins.html', data=data, filename=filename)
+        stat = os.stat(file_path)
+        # Images fall back to the original until their thumbnail exists (made in the background)
+        key = ('view', filename, stat.st_mtime_ns, stat.st_size, thumbnails.derivatives_signature(ATTACHMENTS_DIR))
+        return cached_page(key, render)
     except Exception as e:
         flash(f'Error loading pin file: {e}', 'error')
         return redirect(url_for('index'))
 
+def time_param(name):
+    """Read a ?since=/?until= bound as epoch milliseconds or an ISO date/time (UTC).
+
+    Returns None if absent; raises ValueError if it cannot be parsed.
+    """
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    ms = iso_to_ms(value)
+    if ms is None:
+        raise ValueError(f"Invalid {name}: {value}")
+    return ms
+
+@app.route('/api/archive/<filename>/messages')
+@login_required
+def archive_messages_api(filename):
+    """API endpoint returning one page of an archive's messages by cursor.
+
+    Pass the returned next_cursor back as ?cursor= to get the following
+    page; it is null on the last page. ?q= filters to matching messages,
+    ?since= and ?until= (epoch milliseconds or ISO date/time) to a time range,
+    and ?format=html adds the page pre-rendered for the view page.
+    """
+    cursor = max(request.args.get('cursor', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', ARCHIVE_PAGE_SIZE, type=int), 1), ARCHIVE_MAX_PAGE_SIZE)
+    query = request.args.get('q', '').strip()
+    try:
+        since_ts = time_param('since')
+        until_ts = time_param('until')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    entry = archive_catalog.ensure_indexed(PINS_DATA_DIR, filename)
+    if entry is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    items, next_cursor = archive_catalog.archive_page(
+        PINS_DATA_DIR, filename, cursor=cursor, limit=limit, query=query or None,
+        since_ts=since_ts, until_ts=until_ts
+    )
+    payload = {
+        'filename': filename,
+        'cursor': cursor,
+        'next_cursor': next_cursor,
+        'count': len(items)
+    }
+    if request.args.get('format') == 'html':
+        payload['html'] = render_template('_messages.html', items=items)
+    else:
+        payload['messages'] = items
+    return jsonify(payload)
+
 @app.route('/api/search')
 @login_required
 def search_pins():
-    """API endpoint for searching pins"""
-    query = request.args.get('q', '').lower()
-    if not query:
-        return jsonify([])
-    
-    results = []
-    archive_files = load_all_archives()
-    
-    for file_data in archive_files:
-        for item in file_data.get('items', []):
-            # Search in content and author name
-            if (query in item.get('content', '').lower() or 
-                query in item.get('author', {}).get('name', '').lower()):
-                
-                result = {
-                    'channel': file_data['channel_name'],
-                    'filename': file_data['filename'],
-                    'archive_date': file_data.get('reset_timestamp') or file_data.get('archive_timestamp'),
-                    'archive_type': file_data.get('display_type', 'Unknown'),
-                    'item': item
-                }
-                results.append(result)
-    
-    return jsonify(results[:50])  # Limit to 50 results
+    """API endpoint for ranked, paginated full-text search across all archives"""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+    
+    results, has_more = archive_catalog.search(
+        PINS_DATA_DIR, query, limit=per_page, offset=(page - 1) * per_page
+    ) if query else ([], False)
+    
+    return jsonify({
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more,
+        'results': results
+    })
+
+def _cache_attachment(response):
+    """Mark an attachment response as cacheable for good (only by the logged-in browser)"""
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = ATTACHMENT_CACHE_SECONDS
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/attachments/<path:filename>')
 @login_required
 def serve_attachment(filename):
-    """Serve downloaded attachments"""
+    """Serve downloaded attachments.
+
+    Responses carry an ETag/Last-Modified and honour If-None-Match,
+    If-Modified-Since and Range requests, so repeat views are answered with
+    304s and videos can be seeked without downloading the whole file.
+    """
+    attachment_path = safe_join(ATTACHMENTS_DIR, filename)
+    if attachment_path is None or not os.path.isfile(attachment_path):
+        abort(404)
+    
+    if ATTACHMENT_OFFLOAD == 'x-accel':
+        # nginx serves the file (with its own range/conditional handling) from an internal location.
+        # It URL-decodes the redirect, so quote the name: spaces, '%', '?' or non-ASCII would break it
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{ATTACHMENT_ACCEL_PREFIX.rstrip('/')}/{quote(filename)}"
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return _cache_attachment(response)
+    
+    # Flask resolves relative directories against the app's root, not the working directory
+    response = send_from_directory(os.path.abspath(ATTACHMENTS_DIR), filename, conditional=True, etag=True, max_age=ATTACHMENT_CACHE_SECONDS)
+    return _cache_attachment(response)
+
+def create_app():
+    """WSGI entry point for production servers (see gunicorn.conf.py).
+
+    Brings the archive catalog up to date once, before the server forks its
+    workers, so no worker pays for indexing new archives on its first
+    request. Database connections are opened per request, so nothing opened
+    here is shared between workers.
+    """
+    os.makedirs(PINS_DATA_DIR, exist_ok=True)
+    mimetypes.init()
     try:
-        attachment_path = os.path.join(PINS_DATA_DIR, 'attachments', filename)
-        if os.path.exists(attachment_path):
-            from flask import send_file
-            return send_file(attachment_path)
-        else:
-            flash('Attachment not found', 'error')
-            return redirect(url_for('index'))
+        indexed = archive_catalog.refresh_catalog(PINS_DATA_DIR)
+        print(f"Pins viewer catalog ready ({indexed} archives indexed)")
     except Exception as e:
-        flash(f'Error serving attachment: {e}', 'error')
-        return redirect(url_for('index'))
+        print(f"Could not refresh the archive catalog: {e}")
+    return app
 
 if __name__ == '__main__':
     # Create templates directory and files if they don't exist
@@ -164,7 +304,9 @@ if __name__ == '__main__':
     print("")
     print("Starting web server...")
     print("Access at: http://localhost:5001")
-    if not is_production:
+    if is_production:
+        print("Note: this is Flask's single-process server; use gunicorn -c gunicorn.conf.py for production")
+    else:
         print("Press Ctrl+C to stop")
     
     # SSL context for HTTPS (optional)
@@ -173,7 +315,7 @@ if __name__ == '__main__':
         ssl_context = ('ssl_cert.pem', 'ssl_key.pem')
         print("HTTPS enabled with SSL certificate")
     
-    app.run(
+    create_app().run(
         debug=not is_production, 
         host='0.0.0.0' if is_production else '127.0.0.1', 
         port=5001,
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Thumbnails and web previews for downloaded image attachments
+
+Derivatives are stored next to the content-addressed blobs, named after the
+blob they were made from:
+
+- ``thumbs/<sha256[:2]>/<sha256>.webp``   small image for archive grids
+- ``previews/<sha256[:2]>/<sha256>.webp`` web-sized image for inline display
+
+Pillow is optional: without it no derivatives are generated and the viewer
+keeps showing the original files. Run ``python thumbnails.py`` to backfill
+derivatives for attachments downloaded before this existed.
+"""
+
+import os
+import sys
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+BLOBS_SUBDIR = "blobs"  # Must match ATTACHMENT_BLOBS_SUBDIR in bot.py
+DERIVATIVE_EXTENSION = ".webp"
+DERIVATIVES_STAMP = ".derivatives_updated"  # Touched in the attachments dir whenever a derivative is created
+
+# kind -> (subdirectory, longest edge in pixels, WebP quality)
+DERIVATIVES = {
+    "thumbnail": ("thumbs", 480, 75),
+    "preview": ("previews", 1600, 82),
+}
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+def available():
+    """True if Pillow is installed and derivatives can be generated"""
+    return Image is not None
+
+def is_image(filename, content_type=None):
+    """Whether an attachment is an image we can make derivatives of"""
+    if content_type:
+        return content_type.startswith('image/') and content_type != 'image/svg+xml'
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+def derivative_filename(local_filename, kind):
+    """Path (relative to the attachments directory) of one derivative of a stored attachment"""
+    subdir = DERIVATIVES[kind][0]
+    parts = local_filename.replace('\\', '/').split('/')
+    if len(parts) > 1 and parts[0] == BLOBS_SUBDIR:
+        parts = parts[1:]
+    parts[-1] = os.path.splitext(parts[-1])[0] + DERIVATIVE_EXTENSION
+    return '/'.join([subdir] + parts)
+
+def existing_derivatives(attachments_dir, local_filename):
+    """Return {kind_filename: path} if every derivative already exists on disk, else None"""
+    found = {}
+    for kind in DERIVATIVES:
+        filename = derivative_filename(local_filename, kind)
+        if not os.path.isfile(os.path.join(attachments_dir, filename)):
+            return None
+        found[f"{kind}_filename"] = filename
+    return found
+
+def derivatives_signature(attachments_dir):
+    """Changes whenever any thumbnail/preview is created, so cached pages showing originals can be rebuilt"""
+    try:
+        return os.stat(os.path.join(attachments_dir, DERIVATIVES_STAMP)).st_mtime_ns
+    except OSError:
+        return 0
+
+def _touch_stamp(attachments_dir):
+    path = os.path.join(attachments_dir, DERIVATIVES_STAMP)
+    with open(path, 'a'):
+        pass
+    os.utime(path)
+
+def _web_mode(image):
+    """Convert palette/CMYK/etc. images to a mode WebP can store"""
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    has_alpha = image.mode in ('LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+def generate_derivatives(attachments_dir, local_filename):
+    """Create any missing thumbnail/preview for one stored image.
+
+    Runs in a worker process. Returns {"thumbnail_filename": ..., "preview_filename": ...}
+    for the derivatives that exist afterwards; an empty dict if the image
+    could not be read.
+    """
+    if Image is None:
+        return {}
+
+    source_path = os.path.join(attachments_dir, local_filename)
+    generated = {}
+    created = False
+    try:
+        with Image.open(source_path) as original:
+            # Animated images are reduced to their first frame
+            original.seek(0)
+            image = _web_mode(ImageOps.exif_transpose(original))
+            # Largest first, so each smaller size is resampled from fewer pixels
+            for kind, (subdir, size, quality) in sorted(DERIVATIVES.items(), key=lambda d: -d[1][1]):
+                filename = derivative_filename(local_filename, kind)
+                path = os.path.join(attachments_dir, filename)
+                if not os.path.isfile(path):
+                    image.thumbnail((size, size), Image.LANCZOS)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_path = f"{path}.{os.getpid()}.tmp"
+                    image.save(temp_path, 'WEBP', quality=quality, method=4)
+                    os.replace(temp_path, path)
+                    created = True
+                generated[f"{kind}_filename"] = filename
+        if created:
+            _touch_stamp(attachments_dir)
+    except Exception as e:
+        print(f"Could not make thumbnails for {local_filename}: {e}")
+    return generated
+
+def backfill(attachments_dir):
+    """Generate missing derivatives for every stored image blob"""
+    blobs_dir = os.path.join(attachments_dir, BLOBS_SUBDIR)
+    created = 0
+    for root, _, files in os.walk(blobs_dir):
+        for name in files:
+            if not is_image(name):
+                continue
+            local_filename = os.path.relpath(os.path.join(root, name), attachments_dir).replace(os.sep, '/')
+            if existing_derivatives(attachments_dir, local_filename) is None:
+                if generate_derivatives(attachments_dir, local_filename):
+                    created += 1
+    return created
+
+if __name__ == '__main__':
+    if not available():
+        print("Pillow is not installed: pip install Pillow")
+        sys.exit(1)
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join("pins_data", "attachments")
+    print(f"Generated thumbnails for {backfill(target)} images in {target}")